@@ -0,0 +1,174 @@
+"""
+Benchmarks the two-phase isochrone engine against full graph searches on a synthetic street grid with transit lines.
+
+    python benchmarks/isochrone_engine_benchmark.py --grid-size 150 --line-count 14 --time-minutes 30 --origins 256
+
+Reports wall times per engine and how far two-phase results deviate from full graph searches.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import networkx as nx
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from openlifeworlds.transform.public_transport.data_isochrone_calculator import (  # noqa: E402
+    build_sparse_graph,
+    build_transit_stop_matrix,
+    calculate_travel_times,
+)
+
+# Origin of the synthetic grid, roughly Berlin
+origin_lon, origin_lat = 13.35, 52.48
+# Grid spacing of about 100 meters
+spacing_lon, spacing_lat = 0.0015, 0.0009
+# Walk speed in meters per second
+walk_speed = 1.25
+# Travel time between two stops of a line in seconds, including average waiting
+stop_travel_time = 90
+
+
+def build_graph(grid_size, line_count, seed=1) -> nx.MultiDiGraph:
+    """
+    Builds a street grid with horizontal and vertical transit lines
+    :param grid_size: number of nodes per grid side
+    :param line_count: number of lines per direction, each with line_count stops
+    :param seed: random seed for edge weights
+    :return: graph with integer node IDs
+    """
+    random.seed(seed)
+    graph = nx.MultiDiGraph(crs="EPSG:4326")
+
+    for i in range(grid_size):
+        for j in range(grid_size):
+            graph.add_node(
+                f"w{i}_{j}",
+                x=origin_lon + i * spacing_lon,
+                y=origin_lat + j * spacing_lat,
+            )
+
+    for i in range(grid_size):
+        for j in range(grid_size):
+            for a, b in ((i + 1, j), (i, j + 1)):
+                if a < grid_size and b < grid_size:
+                    weight = 100 / walk_speed * random.uniform(0.8, 1.2)
+                    graph.add_edge(f"w{i}_{j}", f"w{a}_{b}", weight=weight)
+                    graph.add_edge(f"w{a}_{b}", f"w{i}_{j}", weight=weight)
+
+    # Lines run along every n-th grid row and column and stop at every n-th node
+    stop_indices = np.linspace(0, grid_size - 1, line_count).astype(int)
+    for direction in ("h", "v"):
+        for line, fixed in enumerate(stop_indices):
+            stops = []
+            for moving in stop_indices:
+                i, j = (moving, fixed) if direction == "h" else (fixed, moving)
+                stop = f"transit_{direction}{line}_{moving}"
+                graph.add_node(
+                    stop,
+                    x=origin_lon + i * spacing_lon,
+                    y=origin_lat + j * spacing_lat,
+                    node_type="transit",
+                )
+                graph.add_edge(f"w{i}_{j}", stop, weight=0)
+                graph.add_edge(stop, f"w{i}_{j}", weight=0)
+                stops.append(stop)
+
+            for a, b in zip(stops, stops[1:]):
+                graph.add_edge(a, b, weight=stop_travel_time)
+                graph.add_edge(b, a, weight=stop_travel_time)
+
+    return nx.convert_node_labels_to_integers(graph, label_attribute="original_id")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--grid-size", type=int, default=150)
+    parser.add_argument("--line-count", type=int, default=14)
+    parser.add_argument("--time-minutes", type=int, default=30)
+    parser.add_argument("--origins", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-access-minutes", type=float, nargs="+", default=[10])
+    parser.add_argument("--max-egress-minutes", type=float, nargs="+", default=[10])
+    arguments = parser.parse_args()
+
+    sparse_graph = build_sparse_graph(
+        build_graph(arguments.grid_size, arguments.line_count)
+    )
+    cutoff_seconds = arguments.time_minutes * 60
+    origin_positions = np.random.default_rng(1).choice(
+        np.setdiff1d(
+            np.arange(sparse_graph.matrix.shape[0]), sparse_graph.transit_positions
+        ),
+        arguments.origins,
+        replace=False,
+    )
+
+    print(
+        f"{sparse_graph.matrix.shape[0]} nodes, {sparse_graph.matrix.nnz} edges, "
+        f"{len(sparse_graph.transit_positions)} stops, {arguments.origins} origins, "
+        f"{arguments.time_minutes} min",
+        flush=True,
+    )
+
+    start = time.perf_counter()
+    full_results = list(
+        calculate_travel_times(
+            sparse_graph, origin_positions, cutoff_seconds, arguments.batch_size
+        )
+    )
+    full_time = time.perf_counter() - start
+    print(f"full-graph: {full_time:.2f}s", flush=True)
+
+    for max_access_minutes in arguments.max_access_minutes:
+        for max_egress_minutes in arguments.max_egress_minutes:
+            start = time.perf_counter()
+            transit_stop_matrix = build_transit_stop_matrix(
+                sparse_graph,
+                cutoff_seconds,
+                arguments.batch_size,
+                max_access_minutes=max_access_minutes,
+                max_egress_minutes=max_egress_minutes,
+            )
+            precompute_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            two_phase_results = list(
+                calculate_travel_times(
+                    sparse_graph,
+                    origin_positions,
+                    cutoff_seconds,
+                    arguments.batch_size,
+                    transit_stop_matrix,
+                )
+            )
+            two_phase_time = time.perf_counter() - start
+
+            # Two-phase results are a subset of full graph results with equal or longer travel times
+            missing_share, max_delay = [], 0.0
+            for (full_positions, full_travel_times), (positions, travel_times) in zip(
+                full_results, two_phase_results
+            ):
+                indices = np.searchsorted(full_positions, positions)
+                missing_share.append(1 - len(positions) / len(full_positions))
+                max_delay = max(
+                    max_delay,
+                    float(np.max(travel_times - full_travel_times[indices], initial=0)),
+                )
+
+            print(
+                f"two-phase access={max_access_minutes:g}min egress={max_egress_minutes:g}min: "
+                f"{two_phase_time:.2f}s ({full_time / two_phase_time:.1f}x faster) "
+                f"+ {precompute_time:.2f}s precomputation, "
+                f"missing nodes mean {np.mean(missing_share):.2%} max {np.max(missing_share):.2%}, "
+                f"max delay {max_delay:.0f}s",
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Benchmarks the process pool against the thread pool of calculate_reachable_area on a synthetic street grid.
+
+Run on a free-threaded build (python3.13t or later) with several cores to compare the GIL disabled and enabled:
+
+    python3.13t benchmarks/parallel_executor_benchmark.py --grid-size 150 --workers 1 2 4 8
+
+On free-threaded builds each executor runs once with PYTHON_GIL=0 and once with PYTHON_GIL=1, in separate
+subprocesses. On regular builds the GIL is always enabled and only one pass runs.
+
+The thread executor is only worth using over the process pool if this benchmark shows it on such a machine.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import sysconfig
+import tempfile
+import time
+
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from openlifeworlds.transform.public_transport.data_reachable_area_calculator import (  # noqa: E402
+    calculate_reachable_area,
+)
+from openlifeworlds.transform.public_transport.parallel_executor import (  # noqa: E402
+    ExecutorType,
+)
+
+# Origin of the synthetic grid, roughly Berlin
+origin_lon, origin_lat = 13.35, 52.48
+# Grid spacing of about 100 meters
+spacing_lon, spacing_lat = 0.0015, 0.0009
+# Walk speed in meters per second
+walk_speed = 1.25
+
+query = "Berlin, Germany"
+hexagon_resolution = 7
+
+
+def build_graph(grid_size, stop_spacing, seed=1) -> nx.MultiDiGraph:
+    """
+    Builds a street grid with a transit line along its diagonal
+    :param grid_size: number of nodes per grid side
+    :param stop_spacing: number of grid nodes between transit stops
+    :param seed: random seed for edge weights
+    :return: graph with integer node IDs
+    """
+    random.seed(seed)
+    graph = nx.MultiDiGraph(crs="EPSG:4326")
+
+    for i in range(grid_size):
+        for j in range(grid_size):
+            graph.add_node(
+                f"w{i}_{j}",
+                x=origin_lon + i * spacing_lon,
+                y=origin_lat + j * spacing_lat,
+            )
+
+    for i in range(grid_size):
+        for j in range(grid_size):
+            for a, b in ((i + 1, j), (i, j + 1)):
+                if a < grid_size and b < grid_size:
+                    weight = 100 / walk_speed * random.uniform(0.8, 1.2)
+                    graph.add_edge(f"w{i}_{j}", f"w{a}_{b}", weight=weight, length=100)
+                    graph.add_edge(f"w{a}_{b}", f"w{i}_{j}", weight=weight, length=100)
+
+    stops = [f"transit_S{k}" for k in range(0, grid_size, stop_spacing)]
+    for k, stop in zip(range(0, grid_size, stop_spacing), stops):
+        graph.add_node(
+            stop,
+            x=origin_lon + k * spacing_lon + 0.0001,
+            y=origin_lat + k * spacing_lat + 0.0001,
+            node_type="transit",
+        )
+        graph.add_edge(f"w{k}_{k}", stop, weight=0, travel_time=0)
+        graph.add_edge(stop, f"w{k}_{k}", weight=0, travel_time=0)
+
+    for a, b in zip(stops, stops[1:]):
+        graph.add_edge(a, b, weight=120, travel_time=120, edge_type="transit")
+        graph.add_edge(b, a, weight=120, travel_time=120, edge_type="transit")
+
+    return nx.convert_node_labels_to_integers(graph, label_attribute="original_id")
+
+
+def write_points(source_path, grid_size, point_count, seed=1) -> str:
+    """
+    Writes random origins within the grid as the points file read by calculate_reachable_area
+    :param source_path: source path
+    :param grid_size: number of nodes per grid side
+    :param point_count: number of points
+    :param seed: random seed
+    :return: points file path
+    """
+    random.seed(seed)
+    area_prefix = (
+        "-".join(list(reversed(query.split(",")))[1:]).lower().replace(" ", "")
+    )
+    points_geojson_path = os.path.join(
+        source_path,
+        f"{area_prefix}-points",
+        f"{area_prefix}-points-{hexagon_resolution}.geojson",
+    )
+    os.makedirs(os.path.dirname(points_geojson_path), exist_ok=True)
+
+    with open(points_geojson_path, "w", encoding="utf-8") as geojson_file:
+        json.dump(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "geometry": {
+                            "type": "Point",
+                            "coordinates": [
+                                origin_lon
+                                + random.uniform(0, grid_size - 1) * spacing_lon,
+                                origin_lat
+                                + random.uniform(0, grid_size - 1) * spacing_lat,
+                            ],
+                        },
+                        "properties": {},
+                    }
+                    for _ in range(point_count)
+                ],
+            },
+            geojson_file,
+        )
+
+    return points_geojson_path
+
+
+def run_benchmark(arguments):
+    graph = build_graph(arguments.grid_size, arguments.stop_spacing)
+    gil_enabled = sys._is_gil_enabled() if hasattr(sys, "_is_gil_enabled") else True
+
+    print(
+        f"Python {sys.version.split()[0]}, GIL {'enabled' if gil_enabled else 'disabled'}, "
+        f"{os.cpu_count()} cores, {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges, "
+        f"{arguments.points} points, {arguments.time_minutes} min",
+        flush=True,
+    )
+
+    work_path = tempfile.mkdtemp(prefix="parallel-executor-benchmark-")
+    try:
+        write_points(work_path, arguments.grid_size, arguments.points)
+
+        for workers in arguments.workers:
+            for executor_type in (
+                [ExecutorType.PROCESS, ExecutorType.THREAD] if workers > 1 else [None]
+            ):
+                results_path = os.path.join(work_path, "results")
+                shutil.rmtree(results_path, ignore_errors=True)
+
+                start = time.perf_counter()
+                calculate_reachable_area(
+                    work_path,
+                    results_path,
+                    query,
+                    graph,
+                    hexagon_resolution=hexagon_resolution,
+                    time_minutes=arguments.time_minutes,
+                    batch_size=arguments.batch_size,
+                    workers=workers,
+                    executor_type=executor_type or ExecutorType.PROCESS,
+                    clean=True,
+                    quiet=True,
+                )
+                wall_time = time.perf_counter() - start
+
+                print(
+                    f"gil={'on' if gil_enabled else 'off'} workers={workers} "
+                    f"executor={executor_type.value if executor_type else 'serial'} "
+                    f"wall={wall_time:.2f}s",
+                    flush=True,
+                )
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--grid-size", type=int, default=100)
+    parser.add_argument("--stop-spacing", type=int, default=5)
+    parser.add_argument("--points", type=int, default=256)
+    parser.add_argument("--time-minutes", type=int, default=15)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument(
+        "--single-pass",
+        action="store_true",
+        help="run once with the GIL setting of the current interpreter",
+    )
+    arguments = parser.parse_args()
+
+    # Free-threaded builds can re-enable the GIL, so compare both in fresh interpreters
+    if arguments.single_pass or not sysconfig.get_config_var("Py_GIL_DISABLED"):
+        run_benchmark(arguments)
+        return
+
+    for python_gil in ("0", "1"):
+        subprocess.run(
+            [sys.executable, *sys.argv, "--single-pass"],
+            env={**os.environ, "PYTHON_GIL": python_gil},
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,12 @@ import osmnx as ox
 from networkx import MultiDiGraph
 from openlifeworlds.tracking_decorator import TrackingDecorator
 
+from openlifeworlds.transform.vector_file_io import (
+    VectorFileFormat,
+    build_vector_file_path,
+    write_vector_file,
+)
+
 
 @TrackingDecorator.track_time
 def load_osmnx_graph(
@@ -16,6 +22,7 @@ def load_osmnx_graph(
     walk_speed_kph=4.5,
     simplified=False,
     debug=True,
+    debug_vector_file_format=VectorFileFormat.GEOJSON,
     clean=False,
     quiet=False,
 ) -> MultiDiGraph:
@@ -82,7 +89,9 @@ def load_osmnx_graph(
         save_graph_as_graphml(graph, graph_file_path)
         save_graph_as_pickle(graph, pickle_file_path)
         debug and save_graph_as_geojson(
-            graph, geojson_nodes_file_path, geojson_edges_file_path
+            graph,
+            build_vector_file_path(geojson_nodes_file_path, debug_vector_file_format),
+            build_vector_file_path(geojson_edges_file_path, debug_vector_file_format),
         )
 
         not quiet and print(
@@ -141,9 +150,9 @@ def save_graph_as_geojson(graph: MultiDiGraph, nodes_file_path, edges_file_path)
         if edges_gdf[col].apply(lambda x: isinstance(x, list)).any():
             edges_gdf[col] = edges_gdf[col].astype(str)
 
-    # Save as geojson
-    nodes_gdf.to_file(filename=nodes_file_path, driver="GeoJSON")
-    edges_gdf.to_file(filename=edges_file_path, driver="GeoJSON")
+    # Save in the format given by the file extension
+    write_vector_file(nodes_gdf, nodes_file_path)
+    write_vector_file(edges_gdf, edges_file_path)
 
 
 @cache
@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+import shapely
+from pyproj import CRS, Transformer
+from pyproj.aoi import AreaOfInterest
+from pyproj.database import query_utm_crs_info
+
+# Transformers are not shared between threads, so each thread keeps its own
+transformers = threading.local()
+
+
+def estimate_utm_crs(x, y, datum_name="WGS 84") -> CRS:
+    """
+    Estimates the UTM CRS of a lon/lat location
+    :param x: longitude
+    :param y: latitude
+    :param datum_name: datum name
+    :return: UTM CRS
+    """
+    utm_crs_list = query_utm_crs_info(
+        datum_name=datum_name,
+        area_of_interest=AreaOfInterest(
+            west_lon_degree=x,
+            south_lat_degree=y,
+            east_lon_degree=x,
+            north_lat_degree=y,
+        ),
+    )
+
+    return CRS.from_epsg(utm_crs_list[0].code)
+
+
+def get_transformer(from_crs, to_crs) -> Transformer:
+    """
+    Gets a cached transformer between two CRS, created once per thread
+    :param from_crs: source CRS
+    :param to_crs: target CRS
+    :return: transformer using lon/lat axis order
+    """
+    if not hasattr(transformers, "cache"):
+        transformers.cache = {}
+
+    key = (from_crs, to_crs)
+    if key not in transformers.cache:
+        transformers.cache[key] = Transformer.from_crs(from_crs, to_crs, always_xy=True)
+
+    return transformers.cache[key]
+
+
+def transform_coordinates(x, y, from_crs, to_crs) -> (np.ndarray, np.ndarray):
+    return get_transformer(from_crs, to_crs).transform(
+        np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    )
+
+
+def transform_geometry(geometry, from_crs, to_crs):
+    transformer = get_transformer(from_crs, to_crs)
+
+    return shapely.transform(
+        geometry,
+        lambda coordinates: np.column_stack(
+            transformer.transform(coordinates[:, 0], coordinates[:, 1])
+        ),
+    )
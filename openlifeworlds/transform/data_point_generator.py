@@ -1,12 +1,24 @@
 import json
+import math
 import os
 
 import h3
 import numpy as np
-from shapely.geometry import Point
+from shapely import contains_xy, prepare, segmentize
 from shapely.geometry import shape
 
 from openlifeworlds.tracking_decorator import TrackingDecorator
+from openlifeworlds.transform.crs_transformer import (
+    estimate_utm_crs,
+    transform_coordinates,
+    transform_geometry,
+)
+from openlifeworlds.transform.geojson_streamer import FeatureCollectionWriter
+
+# Number of grid points tested against the feature at once
+grid_block_size = 1 << 20
+# Max edge length in degrees before projecting features, about 1 km
+max_segment_degrees = 0.01
 
 
 @TrackingDecorator.track_time
@@ -15,6 +27,8 @@ def generate_points_rectangle(
     query,
     geojson_feature,
     grid_spacing_meters=1_000,
+    grid_offset_meters=(0, 0),
+    staggered=False,
     clean=False,
     quiet=False,
 ):
@@ -24,6 +38,8 @@ def generate_points_rectangle(
     :param query: query
     :param geojson_feature: geojson_feature
     :param grid_spacing_meters: grid spacing in meters
+    :param grid_offset_meters: easting and northing offset of the grid in meters
+    :param staggered: shift every other row by half the grid spacing
     :param clean: clean
     :param quiet: quiet
     :return:
@@ -34,52 +50,94 @@ def generate_points_rectangle(
         "-".join(list(reversed(query.split(",")))[1:]).lower().replace(" ", "")
     )
 
+    # Define grid suffix
+    grid_suffix = (
+        f"-offset-{grid_offset_meters[0]}-{grid_offset_meters[1]}"
+        if any(grid_offset_meters)
+        else ""
+    ) + ("-staggered" if staggered else "")
+
     # Define file paths
     points_geojson_path = os.path.join(
         results_path,
         f"{area_prefix}-points",
-        f"{area_prefix}-points-{grid_spacing_meters}.geojson",
+        f"{area_prefix}-points-{grid_spacing_meters}{grid_suffix}.geojson",
     )
 
     if clean or not os.path.exists(points_geojson_path):
         points = generate_points_in_rectangular_grid(
-            geojson_feature, grid_spacing_meters
+            geojson_feature, grid_spacing_meters, grid_offset_meters, staggered
         )
-        points_geojson = build_geojson(points)
-        write_geojson_file(points_geojson_path, points_geojson, clean, quiet)
+        write_points_geojson_file(points_geojson_path, points, quiet)
     else:
         print(f"✓ Already exists {os.path.basename(points_geojson_path)}")
 
 
-def generate_points_in_rectangular_grid(geojson_feature, grid_spacing_meters):
+def generate_points_in_rectangular_grid(
+    geojson_feature, grid_spacing_meters, grid_offset_meters=(0, 0), staggered=False
+) -> np.ndarray:
+    """
+    Generates grid points within a feature, spaced evenly in meters in the UTM zone of the feature
+    :param geojson_feature: geojson feature
+    :param grid_spacing_meters: grid spacing in meters
+    :param grid_offset_meters: easting and northing offset of the grid in meters
+    :param staggered: shift every other row by half the grid spacing
+    :return: array of lon/lat rows
+    """
     xmin, ymin, xmax, ymax = build_bounding_box_with_padding(geojson_feature)
 
-    factor_degree_to_meters = (
-        111000  # 1 degree of latitude is approximately 111000 meters
+    # Project the feature once so that the grid can be built and filtered in meters,
+    # densified first since straight lon/lat edges become curves in UTM
+    utm_crs = estimate_utm_crs((xmin + xmax) / 2, (ymin + ymax) / 2)
+    geometry = transform_geometry(
+        segmentize(shape(geojson_feature["geometry"]), max_segment_degrees),
+        "EPSG:4326",
+        utm_crs,
+    )
+    prepare(geometry)
+
+    # Align rows and columns to multiples of the spacing plus the offset
+    min_x, min_y, max_x, max_y = geometry.bounds
+    offset_x, offset_y = grid_offset_meters
+    row_indices = build_grid_indices(min_y, max_y, grid_spacing_meters, offset_y)
+    column_indices = build_grid_indices(
+        min_x - (grid_spacing_meters / 2 if staggered else 0),
+        max_x,
+        grid_spacing_meters,
+        offset_x,
     )
 
-    # Calculate latitude and longitude spacing for given grid spacing
-    lat_spacing = grid_spacing_meters / factor_degree_to_meters
-    lon_spacing = grid_spacing_meters / (
-        factor_degree_to_meters * np.cos(np.radians(ymin))
+    northings = row_indices * grid_spacing_meters + offset_y
+    row_shifts = (
+        (row_indices % 2) * grid_spacing_meters / 2
+        if staggered
+        else np.zeros(len(row_indices))
     )
 
-    # Generate grid points
-    latitudes = np.arange(ymin, ymax, lat_spacing)
-    longitudes = np.arange(xmin, xmax, lon_spacing)
+    # Filter points outside the feature block by block so that memory is bounded by the kept points
+    column_block_size = max(grid_block_size // max(len(row_indices), 1), 1)
+    point_blocks = [np.empty((0, 2))]
+    for start in range(0, len(column_indices), column_block_size):
+        eastings = (
+            column_indices[start : start + column_block_size] * grid_spacing_meters
+            + offset_x
+        )
 
-    # Create a meshgrid of latitudes and longitudes
-    grid_latitudes, grid_longitudes = np.meshgrid(latitudes, longitudes)
+        # Flatten the grid column by column to get individual points
+        x = (eastings[:, np.newaxis] + row_shifts[np.newaxis, :]).ravel()
+        y = np.tile(northings, len(eastings))
+        is_inside = is_point_inside_feature(geometry, x, y)
 
-    # Flatten the meshgrid to get individual points
-    points = np.vstack([grid_longitudes.ravel(), grid_latitudes.ravel()]).T
+        point_blocks.append(np.column_stack([x[is_inside], y[is_inside]]))
 
-    # Filter points outside the features in the geojson
-    points = [
-        point for point in points if is_point_inside_feature(geojson_feature, point)
-    ]
+    points = np.concatenate(point_blocks)
 
-    return points
+    # Transform all kept points back to lon/lat at once
+    longitudes, latitudes = transform_coordinates(
+        points[:, 0], points[:, 1], utm_crs, "EPSG:4326"
+    )
+
+    return np.column_stack([longitudes, latitudes])
 
 
 def build_bounding_box_with_padding(geojson_feature):
@@ -96,8 +154,15 @@ def build_bounding_box_with_padding(geojson_feature):
     ]
 
 
-def is_point_inside_feature(geojson_feature, point):
-    return shape(geojson_feature["geometry"]).contains(Point(point[0], point[1]))
+def is_point_inside_feature(geometry, x, y) -> np.ndarray:
+    """
+    Checks which points lie inside a geometry
+    :param geometry: shapely geometry, ideally prepared
+    :param x: x coordinates in the CRS of the geometry
+    :param y: y coordinates in the CRS of the geometry
+    :return: boolean mask
+    """
+    return contains_xy(geometry, x, y)
 
 
 @TrackingDecorator.track_time
@@ -183,6 +248,13 @@ def generate_points_in_hexagonal_grid(geojson_feature, hexagon_resolution, dense
 #
 
 
+def build_grid_indices(min_value, max_value, grid_spacing_meters, offset) -> np.ndarray:
+    return np.arange(
+        math.floor((min_value - offset) / grid_spacing_meters),
+        math.ceil((max_value - offset) / grid_spacing_meters) + 1,
+    )
+
+
 def build_geojson(points):
     return {
         "type": "FeatureCollection",
@@ -201,6 +273,30 @@ def build_geojson(points):
     }
 
 
+def write_points_geojson_file(target_file_path, points, quiet):
+    with FeatureCollectionWriter(
+        target_file_path,
+        {
+            "crs": {
+                "type": "name",
+                "properties": {"name": "urn:ogc:def:crs:OGC:1.3:CRS84"},
+            }
+        },
+    ) as writer:
+        for x, y in points.tolist():
+            writer.write(
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [x, y]},
+                    "properties": {},
+                }
+            )
+
+    not quiet and print(
+        f"✓ Generate points geojson {os.path.basename(target_file_path)}"
+    )
+
+
 def write_geojson_file(target_file_path, geojson, clean, quiet):
     if clean or not os.path.exists(target_file_path):
         os.makedirs(os.path.dirname(target_file_path), exist_ok=True)
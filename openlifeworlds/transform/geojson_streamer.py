@@ -0,0 +1,179 @@
+import json
+import os
+
+# Characters skipped between JSON tokens
+whitespace = " \t\n\r"
+
+
+def read_features(file_path, chunk_size=1 << 16):
+    """
+    Reads the features of a FeatureCollection one by one without loading the whole file
+    :param file_path: GeoJSON file path
+    :param chunk_size: number of characters read at once
+    :return: generator of features in file order
+    """
+    with open(file=file_path, mode="r", encoding="utf-8") as geojson_file:
+        yield from scan_feature_collection(geojson_file, chunk_size, {})
+
+
+def read_header(file_path, chunk_size=1 << 16) -> dict:
+    """
+    Reads the members of a FeatureCollection that precede its features, e.g. type and crs
+    :param file_path: GeoJSON file path
+    :param chunk_size: number of characters read at once
+    :return: members other than features
+    """
+    header = {}
+
+    with open(file=file_path, mode="r", encoding="utf-8") as geojson_file:
+        # Stop at the first feature
+        next(scan_feature_collection(geojson_file, chunk_size, header), None)
+
+    return header
+
+
+class FeatureCollectionWriter:
+    """
+    Writes a FeatureCollection feature by feature, the file only appears once all features are written
+    :param file_path: GeoJSON file path
+    :param header: members written before the features, e.g. type and crs
+    """
+
+    def __init__(self, file_path, header=None):
+        self.file_path = file_path
+        self.header = {"type": "FeatureCollection", **(header or {})}
+        self.temporary_file_path = f"{file_path}.{os.getpid()}.tmp"
+        self.geojson_file = None
+        self.feature_count = 0
+
+    def __enter__(self):
+        # Make results path
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+
+        self.geojson_file = open(self.temporary_file_path, "w", encoding="utf-8")
+        self.geojson_file.write(
+            json.dumps(
+                {key: value for key, value in self.header.items() if key != "features"},
+                ensure_ascii=False,
+            )[:-1]
+        )
+        self.geojson_file.write(', "features": [')
+        return self
+
+    def write(self, feature):
+        if self.feature_count > 0:
+            self.geojson_file.write(", ")
+        self.geojson_file.write(json.dumps(feature, ensure_ascii=False))
+        self.feature_count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.geojson_file.write("]}")
+        self.geojson_file.close()
+
+        # Keep existing files if writing failed
+        if exc_type is None:
+            os.replace(self.temporary_file_path, self.file_path)
+        else:
+            os.remove(self.temporary_file_path)
+
+
+#
+# Helpers
+#
+
+
+def scan_feature_collection(geojson_file, chunk_size, header):
+    decoder = json.JSONDecoder(strict=False)
+    scanner = Scanner(geojson_file, chunk_size)
+
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        return
+
+    while True:
+        key = scanner.decode(decoder)
+        scanner.expect(":")
+
+        if key == "features":
+            scanner.expect("[")
+            if scanner.peek() == "]":
+                scanner.expect("]")
+            else:
+                while True:
+                    yield scanner.decode(decoder)
+                    if scanner.expect(",]") == "]":
+                        break
+        else:
+            header[key] = scanner.decode(decoder)
+
+        if scanner.expect(",}") == "}":
+            return
+
+
+class Scanner:
+    """
+    Buffered reader decoding one JSON value at a time
+    :param text_file: text file
+    :param chunk_size: number of characters read at once
+    """
+
+    def __init__(self, text_file, chunk_size):
+        self.text_file = text_file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def read(self, size):
+        chunk = self.text_file.read(size)
+
+        # Drop consumed characters so that memory stays bounded by the largest value
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        self.eof = len(chunk) < size
+
+    def peek(self) -> str:
+        # Skip whitespace and return the next character without consuming it
+        while True:
+            while (
+                self.position < len(self.buffer)
+                and self.buffer[self.position] in whitespace
+            ):
+                self.position += 1
+
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if self.eof:
+                raise ValueError("Unexpected end of GeoJSON file")
+
+            self.read(self.chunk_size)
+
+    def expect(self, characters) -> str:
+        character = self.peek()
+        if character not in characters:
+            raise ValueError(
+                f"Expected one of {characters!r} in GeoJSON file but found {character!r}"
+            )
+
+        self.position += 1
+        return character
+
+    def decode(self, decoder: json.JSONDecoder):
+        self.peek()
+        size = self.chunk_size
+
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.position)
+
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+
+            # Read more for values spanning chunks, doubling the size for large values
+            self.read(size)
+            size *= 2
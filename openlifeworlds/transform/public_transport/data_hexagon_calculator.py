@@ -1,10 +1,21 @@
 import os
 
 import geopandas as gpd
+import h3
 
 # noinspection PyUnresolvedReferences
 import h3pandas
+import numpy as np
+import pandas as pd
 from openlifeworlds.tracking_decorator import TrackingDecorator
+from shapely import contains_xy, prepare
+
+from openlifeworlds.transform.vector_file_io import (
+    VectorFileFormat,
+    build_vector_file_path,
+    read_vector_file,
+    write_vector_file,
+)
 
 
 @TrackingDecorator.track_time
@@ -15,6 +26,10 @@ def calculate_hexagons(
     geojson_file_path,
     hexagon_resolution=7,
     hexagon_resolution_max=9,
+    hexagon_resolutions=None,
+    metric_columns=None,
+    metric_names=("metric",),
+    vector_file_format=VectorFileFormat.GEOJSON,
     year=2024,
     start_hour=None,
     end_hour=None,
@@ -29,6 +44,10 @@ def calculate_hexagons(
     :param geojson_file_path: geojson file path
     :param hexagon_resolution: hexagon resolution, for edge lengths see https://h3geo.org/docs/core-library/restable#edge-lengths
     :param hexagon_resolution_max: max hexagon resolution
+    :param hexagon_resolutions: hexagon resolutions of a pyramid written in one run instead of the single hexagon resolution
+    :param metric_columns: metric columns as returned by calculate_metrics, read from the metrics file if not set
+    :param metric_names: property names of the metrics averaged per hexagon, e.g. metric or reachable_stations_convex_hull_15min
+    :param vector_file_format: vector file format of the hexagon files, e.g. GeoParquet or FlatGeobuf for large grids
     :param year: year
     :param start_hour: start hour
     :param end_hour: end hour
@@ -52,39 +71,97 @@ def calculate_hexagons(
         f"{area_prefix}-public-transport-{year}-{time_window_suffix}",
         f"{area_prefix}-points-{hexagon_resolution_max}-with-metrics.geojson",
     )
-    hexagon_geojson_path = os.path.join(
-        results_path,
-        f"{area_prefix}-public-transport-{year}-{time_window_suffix}",
-        f"{area_prefix}-points-{hexagon_resolution}-with-hexagons.geojson",
-    )
-
-    if clean or not os.path.exists(hexagon_geojson_path):
-        gp_dataframe_points = gpd.read_file(metrics_geojson_path)
-        gp_dataframe_city = gpd.read_file(geojson_file_path)
-
-        # Calculate hexagons
-        gp_dataframe_exploded = gp_dataframe_city.explode(index_parts=True)
-        gp_dataframe_h3 = gp_dataframe_exploded.h3.polyfill_resample(hexagon_resolution)
-
-        # Blend in metrics
-        gp_dataframe_points_in_polygon = gpd.sjoin(
-            gp_dataframe_points, gp_dataframe_h3, how="inner", predicate="within"
+    hexagon_geojson_paths = {
+        resolution: build_vector_file_path(
+            os.path.join(
+                results_path,
+                f"{area_prefix}-public-transport-{year}-{time_window_suffix}",
+                f"{area_prefix}-points-{resolution}-with-hexagons.geojson",
+            ),
+            vector_file_format,
+        )
+        for resolution in (
+            sorted(set(hexagon_resolutions), reverse=True)
+            if hexagon_resolutions is not None
+            else [hexagon_resolution]
         )
-        gp_dataframe_average_metric = gp_dataframe_points_in_polygon.groupby(
-            "h3_polyfill"
-        )["metric"].mean()
-        gp_dataframe_final = gp_dataframe_h3.merge(
-            gp_dataframe_average_metric, left_index=True, right_index=True
+    }
+
+    if not clean and all(
+        os.path.exists(hexagon_geojson_path)
+        for hexagon_geojson_path in hexagon_geojson_paths.values()
+    ):
+        for hexagon_geojson_path in hexagon_geojson_paths.values():
+            print(f"✓ Already exists {os.path.basename(hexagon_geojson_path)}")
+        return
+
+    dataframe_points = (
+        pd.DataFrame(
+            {
+                "lat": metric_columns["y"],
+                "lng": metric_columns["x"],
+                **{
+                    metric_name: metric_columns[metric_name]
+                    for metric_name in metric_names
+                },
+            }
+        )
+        if metric_columns is not None
+        else read_vector_file(metrics_geojson_path)
+    )
+    gp_dataframe_city = read_vector_file(geojson_file_path)
+
+    if hexagon_resolutions is None:
+        # Assign each point its hexagon and average metrics per hexagon
+        dataframe_average_metric = (
+            dataframe_points.h3.geo_to_h3(
+                hexagon_resolution, lat_col="lat", lng_col="lng"
+            )
+            .groupby(level=0)[list(metric_names)]
+            .mean()
+            .rename_axis("h3_polyfill")
         )
 
+        # Keep hexagons whose centers are within the city like a polyfill would
         write_geojson_file(
-            hexagon_geojson_path,
-            gp_dataframe_final,
+            hexagon_geojson_paths[hexagon_resolution],
+            filter_hexagons_by_city(dataframe_average_metric, gp_dataframe_city),
             clean,
             quiet,
         )
     else:
-        print(f"✓ Already exists {os.path.basename(hexagon_geojson_path)}")
+        # Aggregate sums and counts once at the finest resolution
+        finest_resolution = max(hexagon_geojson_paths.keys())
+        dataframe_grouped = dataframe_points.h3.geo_to_h3(
+            finest_resolution, lat_col="lat", lng_col="lng"
+        ).groupby(level=0)[list(metric_names)]
+        dataframe_totals = pd.concat(
+            [
+                dataframe_grouped.sum().add_suffix("_sum"),
+                dataframe_grouped.count().add_suffix("_count"),
+            ],
+            axis=1,
+        ).rename_axis("h3_polyfill")
+
+        for resolution, hexagon_geojson_path in hexagon_geojson_paths.items():
+            # Roll up to parent hexagons, sums and counts keep means exact
+            if resolution != finest_resolution:
+                dataframe_totals = roll_up_hexagons(dataframe_totals, resolution)
+
+            dataframe_average_metric = pd.concat(
+                [
+                    build_means(dataframe_totals, metric_names),
+                    dataframe_totals,
+                ],
+                axis=1,
+            )
+
+            write_geojson_file(
+                hexagon_geojson_path,
+                filter_hexagons_by_city(dataframe_average_metric, gp_dataframe_city),
+                clean,
+                quiet,
+            )
 
 
 #
@@ -92,12 +169,61 @@ def calculate_hexagons(
 #
 
 
+def filter_hexagons_by_city(dataframe_hexagons, gp_dataframe_city) -> gpd.GeoDataFrame:
+    # Test hexagon centers against each city part, the first containing part wins
+    gp_dataframe_exploded = gp_dataframe_city.explode(index_parts=True).reset_index()
+    centers = np.array([h3.cell_to_latlng(cell) for cell in dataframe_hexagons.index])
+    part_indices = np.full(len(dataframe_hexagons), -1, dtype=np.int64)
+
+    if len(centers) > 0:
+        for part_index, geometry in enumerate(gp_dataframe_exploded.geometry):
+            prepare(geometry)
+            is_unassigned = part_indices < 0
+            part_indices[
+                is_unassigned & contains_xy(geometry, centers[:, 1], centers[:, 0])
+            ] = part_index
+
+    # Broadcast the attributes of the containing part and build polygons only for the kept hexagons
+    is_within = part_indices >= 0
+    attributes = (
+        gp_dataframe_exploded.drop(columns="geometry")
+        .iloc[part_indices[is_within]]
+        .set_index(dataframe_hexagons.index[is_within])
+    )
+
+    return attributes.join(dataframe_hexagons[is_within]).h3.h3_to_geo_boundary()
+
+
+def roll_up_hexagons(dataframe_totals, resolution) -> pd.DataFrame:
+    return (
+        dataframe_totals.groupby(
+            [h3.cell_to_parent(cell, resolution) for cell in dataframe_totals.index]
+        )
+        .sum()
+        .rename_axis("h3_polyfill")
+    )
+
+
+def build_means(dataframe_totals, metric_names) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            metric_name: dataframe_totals[f"{metric_name}_sum"]
+            / dataframe_totals[f"{metric_name}_count"].where(
+                dataframe_totals[f"{metric_name}_count"] > 0
+            )
+            for metric_name in metric_names
+        },
+        index=dataframe_totals.index,
+    )
+
+
 def write_geojson_file(file_path, gp_dataframe, clean, quiet):
     if not os.path.exists(file_path) or clean:
         # Make results path
         os.makedirs(os.path.join(os.path.dirname(file_path)), exist_ok=True)
 
-        gp_dataframe.to_file(file_path)
+        # Write the hexagon index as a column in all formats
+        write_vector_file(gp_dataframe.reset_index(), file_path)
 
         not quiet and print(f"✓ Generate hexagons into {os.path.basename(file_path)}")
     else:
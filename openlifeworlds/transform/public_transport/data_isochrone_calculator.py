@@ -0,0 +1,657 @@
+import hashlib
+from functools import cached_property
+from dataclasses import dataclass, replace
+from enum import Enum
+
+import numpy as np
+from networkx import MultiDiGraph
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from shapely import MultiPoint
+
+from openlifeworlds.transform.public_transport.data_reachable_points_calculator import (
+    NodeIndex,
+    build_node_index,
+    snap_positions,
+)
+from openlifeworlds.transform.public_transport.isochrone_cache import IsochroneCache
+from openlifeworlds.transform.public_transport.parallel_executor import (
+    ExecutorType,
+    init_worker,
+    map_ordered,
+    worker_state,
+)
+
+
+@dataclass(frozen=True)
+class SparseGraph:
+    """
+    Compressed sparse row representation of a graph used for batched shortest path searches
+    :param node_index: spatial index over the nodes, positions match matrix rows and columns
+    :param matrix: adjacency matrix holding the minimum edge weight between two nodes
+    :param fingerprint: hash of nodes and edges identifying the graph across runs
+    :param transit_positions: positions of transit stop nodes
+    :param transit_stop_ids: GTFS stop IDs of transit stop nodes
+    """
+
+    node_index: NodeIndex
+    matrix: csr_matrix
+    fingerprint: str
+    transit_positions: np.ndarray
+    transit_stop_ids: np.ndarray
+
+    @cached_property
+    def reversed_graph(self) -> "SparseGraph":
+        """
+        Same graph with all edges reversed for searches towards destinations, built once on first use
+        """
+        # Transposing keeps explicit zeros, the node positions stay the same
+        return replace(
+            self,
+            matrix=self.matrix.transpose().tocsr(),
+            fingerprint=f"{self.fingerprint}-reverse",
+        )
+
+
+def build_sparse_graph(graph: MultiDiGraph, weight="weight") -> SparseGraph:
+    """
+    Converts a graph into a sparse adjacency matrix, built once per graph
+    :param graph: graph
+    :param weight: edge attribute used as weight, missing values count as 1 like in networkx
+    :return: sparse graph
+    """
+    node_index = build_node_index(graph)
+    positions = {node_id: position for position, node_id in enumerate(graph.nodes)}
+
+    edges = np.array(
+        [
+            (positions[u], positions[v], data.get(weight, 1))
+            for u, v, data in graph.edges(data=True)
+        ],
+        dtype=float,
+    ).reshape(-1, 3)
+
+    # Drop edges that can never be part of a bounded search
+    edges = edges[np.isfinite(edges[:, 2])]
+
+    # Keep the cheapest of parallel edges
+    edges = edges[np.lexsort((edges[:, 2], edges[:, 1], edges[:, 0]))]
+    first = np.ones(len(edges), dtype=bool)
+    first[1:] = (np.diff(edges[:, 0]) != 0) | (np.diff(edges[:, 1]) != 0)
+    edges = edges[first]
+
+    # Explicit zeros are kept as edges by csgraph
+    matrix = csr_matrix(
+        (edges[:, 2], (edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64))),
+        shape=(len(positions), len(positions)),
+    )
+
+    # Find transit stops, whose original IDs are prefixed with "transit_"
+    transit_nodes = [
+        (position, str(data.get("original_id", node_id)).removeprefix("transit_"))
+        for position, (node_id, data) in enumerate(graph.nodes(data=True))
+        if data.get("node_type") == "transit"
+        or str(data.get("original_id", node_id)).startswith("transit_")
+    ]
+
+    return SparseGraph(
+        node_index=node_index,
+        matrix=matrix,
+        fingerprint=build_fingerprint(node_index, matrix),
+        transit_positions=np.array(
+            [position for position, _ in transit_nodes], dtype=np.int64
+        ),
+        transit_stop_ids=np.array(
+            [stop_id for _, stop_id in transit_nodes], dtype=object
+        ),
+    )
+
+
+class IsochroneEngineType(Enum):
+    FULL_GRAPH = "full-graph"
+    TWO_PHASE = "two-phase"
+
+
+@dataclass(frozen=True)
+class TransitStopMatrix:
+    """
+    Precomputed transit phase of a sparse graph for two-phase searches
+    :param access_matrix: adjacency matrix without edges leaving transit stops, used for walks to the first stop
+    :param stop_lookup: stop index by node position, -1 for nodes that are no stops
+    :param stop_to_stop: travel times from each stop to each stop, including transfer walks, up to the cutoff,
+    rows sorted by travel time
+    :param egress: walking times from each stop to each node without passing another stop, up to the egress budget,
+    rows sorted by travel time
+    :param stop_to_stop_keys: ascending keys of the stop_to_stop entries for finding row prefixes within a budget
+    :param egress_keys: ascending keys of the egress entries for finding row prefixes within a budget
+    :param cutoff_seconds: maximum travel time the matrix was built for
+    :param max_access_seconds: walk budget from an origin, to its first stop or on foot only
+    :param max_egress_seconds: walk budget from the last stop
+    """
+
+    access_matrix: csr_matrix
+    stop_lookup: np.ndarray
+    stop_to_stop: csr_matrix
+    egress: csr_matrix
+    stop_to_stop_keys: np.ndarray
+    egress_keys: np.ndarray
+    cutoff_seconds: float
+    max_access_seconds: float
+    max_egress_seconds: float
+
+
+def build_transit_stop_matrix(
+    sparse_graph: SparseGraph,
+    cutoff_seconds,
+    batch_size=32,
+    max_access_minutes=None,
+    max_egress_minutes=None,
+) -> TransitStopMatrix:
+    """
+    Precomputes stop-to-stop travel times and egress walks once per graph, i.e. per time window.
+    Without walk budgets two-phase searches return the same travel times as full graph searches. With walk budgets
+    they only follow paths whose walk before the first stop, or on foot only, fits the access budget and whose walk
+    after the last stop fits the egress budget, like journey planners do. Nodes only reachable by longer walks are
+    then missing and nodes reached faster by longer walks get longer travel times, all other travel times stay exact.
+    The precomputation costs about as much as full graph searches from all stops, see
+    benchmarks/isochrone_engine_benchmark.py, so it pays off for runs with thousands of origins.
+    :param sparse_graph: sparse graph
+    :param cutoff_seconds: maximum travel time in seconds, searches with larger cutoffs are not supported
+    :param batch_size: number of stops searched at once
+    :param max_access_minutes: walk budget from an origin in minutes, to its first stop or on foot only, unbounded if not set
+    :param max_egress_minutes: walk budget from the last stop in minutes, unbounded if not set
+    :return: transit stop matrix
+    """
+    max_access_seconds = min(
+        cutoff_seconds,
+        max_access_minutes * 60 if max_access_minutes is not None else np.inf,
+    )
+    max_egress_seconds = min(
+        cutoff_seconds,
+        max_egress_minutes * 60 if max_egress_minutes is not None else np.inf,
+    )
+
+    node_count = sparse_graph.matrix.shape[0]
+    stop_positions = sparse_graph.transit_positions
+
+    is_stop = np.zeros(node_count, dtype=bool)
+    is_stop[stop_positions] = True
+
+    stop_lookup = np.full(node_count, -1, dtype=np.int64)
+    stop_lookup[stop_positions] = np.arange(len(stop_positions))
+
+    # Every path is a walk to its first stop, a trip between its first and last stop, and a walk from its last stop
+    edges = sparse_graph.matrix.tocoo()
+    access_matrix = build_matrix(edges, ~is_stop[edges.row], (node_count, node_count))
+    egress_matrix = build_matrix(edges, ~is_stop[edges.col], (node_count, node_count))
+
+    stop_to_stop, egress = build_stop_matrices(
+        sparse_graph.matrix,
+        egress_matrix,
+        stop_positions,
+        cutoff_seconds,
+        max_egress_seconds,
+        batch_size,
+    )
+
+    return TransitStopMatrix(
+        access_matrix=access_matrix,
+        stop_lookup=stop_lookup,
+        stop_to_stop=stop_to_stop,
+        egress=egress,
+        stop_to_stop_keys=build_row_keys(stop_to_stop, cutoff_seconds),
+        egress_keys=build_row_keys(egress, cutoff_seconds),
+        cutoff_seconds=cutoff_seconds,
+        max_access_seconds=max_access_seconds,
+        max_egress_seconds=max_egress_seconds,
+    )
+
+
+def calculate_travel_times_two_phase(
+    transit_stop_matrix: TransitStopMatrix,
+    origin_positions,
+    cutoff_seconds,
+    batch_size=32,
+):
+    """
+    Runs short walk searches from many origins and completes them with the precomputed transit phase
+    :param transit_stop_matrix: transit stop matrix
+    :param origin_positions: node positions of the origins
+    :param cutoff_seconds: maximum travel time in seconds, at most the cutoff of the transit stop matrix
+    :param batch_size: number of origins searched at once
+    :return: generator of reached node positions and travel times per origin, in origin order
+    """
+    if cutoff_seconds > transit_stop_matrix.cutoff_seconds:
+        raise ValueError(
+            f"Cutoff of {cutoff_seconds}s exceeds the cutoff of the transit stop matrix of {transit_stop_matrix.cutoff_seconds}s"
+        )
+
+    origin_positions = np.asarray(origin_positions, dtype=np.int64)
+    node_count = transit_stop_matrix.access_matrix.shape[0]
+    stop_count = transit_stop_matrix.stop_to_stop.shape[0]
+
+    for start in range(0, len(origin_positions), batch_size):
+        access_travel_times = dijkstra(
+            transit_stop_matrix.access_matrix,
+            directed=True,
+            indices=origin_positions[start : start + batch_size],
+            limit=min(cutoff_seconds, transit_stop_matrix.max_access_seconds),
+        ).reshape(-1, node_count)
+
+        for row in access_travel_times:
+            # Walk to the first stops
+            access_positions = np.flatnonzero(np.isfinite(row))
+            access_stops = transit_stop_matrix.stop_lookup[access_positions]
+            is_access_stop = access_stops >= 0
+
+            # Ride from the first stops to all last stops, keeping the fastest arrival per stop
+            stop_row = np.full(stop_count, np.inf)
+            np.minimum.at(
+                stop_row,
+                *scan_rows(
+                    transit_stop_matrix.stop_to_stop,
+                    transit_stop_matrix.stop_to_stop_keys,
+                    transit_stop_matrix.cutoff_seconds,
+                    access_stops[is_access_stop],
+                    row[access_positions][is_access_stop],
+                    cutoff_seconds,
+                ),
+            )
+            stops = np.flatnonzero(np.isfinite(stop_row))
+
+            # Walk from the last stops, keeping the fastest arrival per node in the dense row
+            np.minimum.at(
+                row,
+                *scan_rows(
+                    transit_stop_matrix.egress,
+                    transit_stop_matrix.egress_keys,
+                    transit_stop_matrix.cutoff_seconds,
+                    stops,
+                    stop_row[stops],
+                    cutoff_seconds,
+                ),
+            )
+
+            reached_positions = np.flatnonzero(np.isfinite(row))
+            yield reached_positions, row[reached_positions]
+
+
+def calculate_travel_times(
+    sparse_graph: SparseGraph,
+    origin_positions,
+    cutoff_seconds,
+    batch_size=32,
+    transit_stop_matrix: TransitStopMatrix = None,
+):
+    """
+    Runs bounded Dijkstra searches from many origins in batches
+    :param sparse_graph: sparse graph
+    :param origin_positions: node positions of the origins
+    :param cutoff_seconds: maximum travel time in seconds
+    :param batch_size: number of origins searched at once, memory grows with batch size times node count
+    :param transit_stop_matrix: transit stop matrix for two-phase searches, full searches are run if not set
+    :return: generator of reached node positions and travel times per origin, in origin order
+    """
+    if transit_stop_matrix is not None:
+        yield from calculate_travel_times_two_phase(
+            transit_stop_matrix, origin_positions, cutoff_seconds, batch_size
+        )
+        return
+
+    origin_positions = np.asarray(origin_positions, dtype=np.int64)
+
+    for start in range(0, len(origin_positions), batch_size):
+        travel_times = dijkstra(
+            sparse_graph.matrix,
+            directed=True,
+            indices=origin_positions[start : start + batch_size],
+            limit=cutoff_seconds,
+        ).reshape(-1, sparse_graph.matrix.shape[0])
+
+        for row in travel_times:
+            reached_positions = np.flatnonzero(np.isfinite(row))
+            yield reached_positions, row[reached_positions]
+
+
+def calculate_travel_times_cached(
+    sparse_graph: SparseGraph,
+    origin_positions,
+    cutoff_seconds,
+    batch_size=32,
+    isochrone_cache: IsochroneCache = None,
+    transit_stop_matrix: TransitStopMatrix = None,
+):
+    """
+    Runs bounded Dijkstra searches only for origins that are not cached yet
+    :param sparse_graph: sparse graph
+    :param origin_positions: node positions of the origins
+    :param cutoff_seconds: maximum travel time in seconds
+    :param batch_size: number of origins searched at once
+    :param isochrone_cache: isochrone cache, nothing is cached if not set
+    :param transit_stop_matrix: transit stop matrix for two-phase searches, full searches are run if not set
+    :return: list of reached node positions and travel times per origin, in origin order
+    """
+    # Walk budgets below the cutoff change results, so they are cached separately
+    fingerprint = sparse_graph.fingerprint
+    if transit_stop_matrix is not None and cutoff_seconds > min(
+        transit_stop_matrix.max_access_seconds, transit_stop_matrix.max_egress_seconds
+    ):
+        fingerprint = (
+            f"{fingerprint}-access-{transit_stop_matrix.max_access_seconds:g}"
+            f"-egress-{transit_stop_matrix.max_egress_seconds:g}"
+        )
+
+    if isochrone_cache is None:
+        return list(
+            calculate_travel_times(
+                sparse_graph,
+                origin_positions,
+                cutoff_seconds,
+                batch_size,
+                transit_stop_matrix,
+            )
+        )
+
+    results = [
+        isochrone_cache.get(fingerprint, origin_position, cutoff_seconds)
+        for origin_position in origin_positions
+    ]
+    missing_indices = [index for index, result in enumerate(results) if result is None]
+
+    for index, (reached_positions, travel_times) in zip(
+        missing_indices,
+        calculate_travel_times(
+            sparse_graph,
+            [origin_positions[index] for index in missing_indices],
+            cutoff_seconds,
+            batch_size,
+            transit_stop_matrix,
+        ),
+    ):
+        isochrone_cache.put(
+            fingerprint,
+            origin_positions[index],
+            cutoff_seconds,
+            reached_positions,
+            travel_times,
+        )
+        results[index] = (reached_positions, travel_times)
+
+    return results
+
+
+def snap_origins(sparse_graph: SparseGraph, points) -> np.ndarray:
+    """
+    Snaps origin points to their nearest graph nodes at once
+    :param sparse_graph: sparse graph
+    :param points: lon/lat coordinates of the origins
+    :return: node positions of the origins
+    """
+    return snap_positions(
+        sparse_graph.node_index,
+        [point[0] for point in points],
+        [point[1] for point in points],
+    )
+
+
+def map_origin_chunks(
+    function,
+    sparse_graph: SparseGraph,
+    origins,
+    cutoff_seconds,
+    state=None,
+    isochrone_engine_type=IsochroneEngineType.FULL_GRAPH,
+    max_access_minutes=None,
+    max_egress_minutes=None,
+    batch_size=32,
+    workers=1,
+    executor_type=ExecutorType.PROCESS,
+    isochrone_cache: IsochroneCache = None,
+    quiet=False,
+):
+    """
+    Splits origins into chunks that are searched as one batch and applies a function to them in a worker pool.
+    The function reads the stage state from worker_state and searches via calculate_chunk_travel_times.
+    :param function: module-level function called with a chunk of origins
+    :param sparse_graph: sparse graph searched from the origins
+    :param origins: picklable origins, e.g. tuples holding node positions
+    :param cutoff_seconds: maximum travel time in seconds
+    :param state: read-only state of the stage passed to the workers
+    :param isochrone_engine_type: isochrone engine type
+    :param max_access_minutes: walk budget of the two-phase engine from an origin, exact results if not set
+    :param max_egress_minutes: walk budget of the two-phase engine from the last stop, exact results if not set
+    :param batch_size: number of origins per chunk
+    :param workers: number of workers, 1 runs in the current thread
+    :param executor_type: executor type
+    :param isochrone_cache: isochrone cache, nothing is cached if not set
+    :param quiet: suppress output
+    :return: generator of results per chunk in origin order
+    """
+    chunks = [
+        origins[start : start + batch_size]
+        for start in range(0, len(origins), batch_size)
+    ]
+
+    # Precompute the transit phase once so that each origin only needs a walk search to its first stops
+    transit_stop_matrix = None
+    if (
+        IsochroneEngineType(isochrone_engine_type) == IsochroneEngineType.TWO_PHASE
+        and chunks
+    ):
+        not quiet and print("Build transit stop matrix")
+        transit_stop_matrix = build_transit_stop_matrix(
+            sparse_graph,
+            cutoff_seconds,
+            batch_size=batch_size,
+            max_access_minutes=max_access_minutes,
+            max_egress_minutes=max_egress_minutes,
+        )
+
+    try:
+        yield from map_ordered(
+            function,
+            chunks,
+            workers=workers,
+            initializer=init_worker,
+            initargs=(
+                {
+                    **(state or {}),
+                    "sparse_graph": sparse_graph,
+                    "cutoff_seconds": cutoff_seconds,
+                    "isochrone_cache": isochrone_cache,
+                    "transit_stop_matrix": transit_stop_matrix,
+                },
+            ),
+            executor_type=executor_type,
+        )
+    finally:
+        worker_state.clear()
+
+
+def calculate_chunk_travel_times(origin_positions):
+    """
+    Searches the origins of a chunk as one batch, called by functions applied via map_origin_chunks
+    :param origin_positions: node positions of the origins
+    :return: list of reached node positions and travel times per origin, in origin order
+    """
+    return calculate_travel_times_cached(
+        worker_state["sparse_graph"],
+        origin_positions,
+        worker_state["cutoff_seconds"],
+        batch_size=len(origin_positions),
+        isochrone_cache=worker_state["isochrone_cache"],
+        transit_stop_matrix=worker_state["transit_stop_matrix"],
+    )
+
+
+def calculate_reachable_nodes(
+    sparse_graph: SparseGraph,
+    origin_positions,
+    time_minutes,
+    batch_size=32,
+    reverse=False,
+) -> list[np.ndarray]:
+    """
+    Calculates the node positions reachable from each origin within a given time
+    :param sparse_graph: sparse graph
+    :param origin_positions: node positions of the origins, or of the destinations if reverse is set
+    :param time_minutes: time budget in minutes
+    :param batch_size: number of origins searched at once
+    :param reverse: find the nodes from which each destination is reachable instead
+    :return: reached node positions per origin
+    """
+    return [
+        reached_positions
+        for reached_positions, _ in calculate_travel_times(
+            sparse_graph.reversed_graph if reverse else sparse_graph,
+            origin_positions,
+            time_minutes * 60,
+            batch_size,
+        )
+    ]
+
+
+def build_reachable_points(
+    sparse_graph: SparseGraph, reached_positions, node_coordinates=None
+) -> MultiPoint:
+    """
+    Builds the points of reached nodes
+    :param sparse_graph: sparse graph
+    :param reached_positions: reached node positions
+    :param node_coordinates: x and y arrays of all nodes, e.g. projected once per run, defaults to lon/lat
+    :return: reached points
+    """
+    node_index = sparse_graph.node_index
+    x, y = (
+        node_coordinates
+        if node_coordinates is not None
+        else (node_index.x, node_index.y)
+    )
+    reached_positions = np.intersect1d(
+        reached_positions, node_index.valid_positions, assume_unique=True
+    )
+
+    return MultiPoint(np.column_stack([x[reached_positions], y[reached_positions]]))
+
+
+#
+# Helpers
+#
+
+
+def build_fingerprint(node_index: NodeIndex, matrix: csr_matrix) -> str:
+    fingerprint = hashlib.sha1()
+    for array in (
+        node_index.x,
+        node_index.y,
+        matrix.indptr,
+        matrix.indices,
+        matrix.data,
+    ):
+        fingerprint.update(np.ascontiguousarray(array).tobytes())
+
+    return fingerprint.hexdigest()
+
+
+def build_matrix(edges: coo_matrix, keep, shape) -> csr_matrix:
+    # Build from coordinates so that explicit zero weights are kept
+    return csr_matrix(
+        (edges.data[keep], (edges.row[keep], edges.col[keep])), shape=shape
+    )
+
+
+def build_stop_matrices(
+    matrix: csr_matrix,
+    egress_matrix: csr_matrix,
+    stop_positions,
+    cutoff_seconds,
+    max_egress_seconds,
+    batch_size,
+) -> (csr_matrix, csr_matrix):
+    stop_to_stop_rows = []
+    egress_rows = []
+
+    for start in range(0, len(stop_positions), batch_size):
+        sources = stop_positions[start : start + batch_size]
+        travel_times = dijkstra(
+            matrix, directed=True, indices=sources, limit=cutoff_seconds
+        ).reshape(-1, matrix.shape[0])
+        egress_travel_times = dijkstra(
+            egress_matrix, directed=True, indices=sources, limit=max_egress_seconds
+        ).reshape(-1, matrix.shape[0])
+
+        # Any path from a stop is a ride to a last stop plus an egress walk, so the walk from this stop is only
+        # needed for nodes it reaches as fast as the full graph does, the other nodes are covered by faster last stops
+        egress_travel_times[egress_travel_times > travel_times + 1e-9] = np.inf
+
+        stop_to_stop_rows.append(build_sorted_rows(travel_times[:, stop_positions]))
+        egress_rows.append(build_sorted_rows(egress_travel_times))
+
+    return (
+        concatenate_sorted_rows(stop_to_stop_rows, len(stop_positions)),
+        concatenate_sorted_rows(egress_rows, matrix.shape[0]),
+    )
+
+
+def build_sorted_rows(travel_times) -> (np.ndarray, np.ndarray, np.ndarray):
+    # Store finite travel times only, zeros included, each row sorted by travel time so that scans can stop at their budget
+    rows, columns = np.nonzero(np.isfinite(travel_times))
+    values = travel_times[rows, columns]
+    order = np.lexsort((values, rows))
+
+    return (
+        np.bincount(rows, minlength=len(travel_times)),
+        columns[order],
+        values[order],
+    )
+
+
+def concatenate_sorted_rows(sorted_rows, column_count) -> csr_matrix:
+    lengths, indices, data = (
+        [np.concatenate(parts) for parts in zip(*sorted_rows)]
+        if sorted_rows
+        else (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))
+    )
+
+    return csr_matrix(
+        (data, indices, np.concatenate([[0], np.cumsum(lengths)])),
+        shape=(len(lengths), column_count),
+    )
+
+
+def build_row_keys(matrix: csr_matrix, cutoff_seconds) -> np.ndarray:
+    # Entries sorted by travel time within rows get ascending keys, as travel times never exceed the cutoff
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    return rows * (cutoff_seconds + 1.0) + matrix.data
+
+
+def scan_rows(
+    matrix: csr_matrix, keys, key_cutoff_seconds, rows, offsets, cutoff_seconds
+) -> (np.ndarray, np.ndarray):
+    # Concatenate the prefixes of the given rows that stay within the cutoff, each shifted by its offset
+    starts = matrix.indptr[rows]
+    ends = np.searchsorted(
+        keys, rows * (key_cutoff_seconds + 1.0) + (cutoff_seconds - offsets), "right"
+    )
+    lengths = ends - starts
+
+    entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(
+        lengths.sum()
+    )
+
+    return (
+        matrix.indices[entries],
+        matrix.data[entries] + np.repeat(offsets, lengths),
+    )
+
+
+def keep_minimum(positions, travel_times) -> (np.ndarray, np.ndarray):
+    # Sort by position, then by travel time, and keep the first entry of each position
+    order = np.lexsort((travel_times, positions))
+    positions = positions[order]
+    travel_times = travel_times[order]
+
+    first = np.ones(len(positions), dtype=bool)
+    first[1:] = positions[1:] != positions[:-1]
+
+    return positions[first], travel_times[first]
@@ -1,10 +1,147 @@
-import json
+import math
 import os
-from functools import lru_cache, cache
+import re
+from array import array
 
+import numpy as np
 from openlifeworlds.tracking_decorator import TrackingDecorator
 from tqdm import tqdm
 
+from openlifeworlds.transform.geojson_streamer import (
+    FeatureCollectionWriter,
+    read_features,
+    read_header,
+)
+from openlifeworlds.transform.public_transport.data_opportunity_calculator import (
+    DecayType,
+    build_opportunity_property_name,
+)
+from openlifeworlds.transform.public_transport.data_reachable_area_calculator import (
+    build_time_budget_suffix,
+)
+
+# Property suffix of another time budget, e.g. _15min
+time_budget_suffix_pattern = re.compile(r"_\d+min$")
+
+
+def property_metric(property_name):
+    """
+    Builds a metric reading a single property
+    :param property_name: property name without time budget suffix
+    :return: metric function, raising an error if the property is missing
+    """
+    return lambda properties, suffix: read_property(
+        properties, f"{property_name}{suffix}"
+    )
+
+
+def sum_metric(prefix):
+    """
+    Builds a metric summing all numeric properties with a given prefix, e.g. station counts of all types
+    :param prefix: property name prefix, followed by a type and the time budget suffix
+    :return: metric function, raising an error if no property matches
+    """
+
+    def metric(properties, suffix):
+        values = [
+            value
+            for key, value in properties.items()
+            if key.startswith(prefix)
+            and key.endswith(suffix)
+            and not time_budget_suffix_pattern.search(key.removesuffix(suffix))
+            and isinstance(value, (int, float))
+            and not isinstance(value, bool)
+        ]
+
+        if not values:
+            raise ValueError(f"Feature has no numeric property {prefix}*{suffix}")
+
+        return sum(values)
+
+    return metric
+
+
+def ratio_metric(numerator, denominator, factor=1):
+    """
+    Builds a metric dividing two properties or metrics
+    :param numerator: numerator property name or metric function
+    :param denominator: denominator property name or metric function
+    :param factor: factor applied to the ratio, e.g. to convert square meters into square kilometers
+    :return: metric function, returning None if the denominator is zero
+    """
+    numerator_metric = (
+        property_metric(numerator) if isinstance(numerator, str) else numerator
+    )
+    denominator_metric = (
+        property_metric(denominator) if isinstance(denominator, str) else denominator
+    )
+
+    def metric(properties, suffix):
+        numerator_value = numerator_metric(properties, suffix)
+        denominator_value = denominator_metric(properties, suffix)
+
+        return (
+            numerator_value / denominator_value * factor
+            if numerator_value is not None and denominator_value
+            else None
+        )
+
+    return metric
+
+
+def opportunity_metric(name, decay_type: DecayType):
+    """
+    Builds a metric reading the opportunities of a single layer
+    :param name: opportunity layer name
+    :param decay_type: decay type
+    :return: metric function, raising an error if the property is missing
+    """
+    return property_metric(build_opportunity_property_name(name, DecayType(decay_type)))
+
+
+# Metrics by name, extended with register_metric, e.g. with an opportunity_metric per opportunity layer
+metric_registry = {
+    "reachable_area_convex_hull": property_metric("reachable_area_convex_hull"),
+    "reachable_area_concave_hull": property_metric("reachable_area_concave_hull"),
+    "reachable_area_union_of_buffers": property_metric(
+        "reachable_area_union_of_buffers"
+    ),
+    "reachable_area_grid_coverage": property_metric("reachable_area_grid_coverage"),
+    "reachable_stations_convex_hull": sum_metric("reachable_stations_convex_hull_"),
+    "reachable_stations_concave_hull": sum_metric("reachable_stations_concave_hull_"),
+    "reachable_stations_union_of_buffers": sum_metric(
+        "reachable_stations_union_of_buffers_"
+    ),
+    "reachable_stations_graph": sum_metric("reachable_stations_graph_"),
+    "concave_to_convex_hull_ratio": ratio_metric(
+        "reachable_area_concave_hull", "reachable_area_convex_hull"
+    ),
+    "reachable_stations_per_square_kilometer": ratio_metric(
+        sum_metric("reachable_stations_union_of_buffers_"),
+        "reachable_area_union_of_buffers",
+        factor=1_000_000,
+    ),
+}
+
+
+def register_metric(name, metric):
+    """
+    Registers a metric so that it can be selected by name
+    :param name: metric name, used as property name together with the time budget suffix
+    :param metric: function calculating the metric from the properties of a feature and a time budget suffix
+    """
+    metric_registry[name] = metric
+
+
+def build_metric_property_name(metric_name, time_minutes=None) -> str:
+    """
+    Builds the property name of a metric
+    :param metric_name: metric name
+    :param time_minutes: time budget in minutes, if reachable areas are calculated for several time budgets
+    :return: property name, e.g. reachable_stations_convex_hull_15min
+    """
+    return f"{metric_name}{build_time_budget_suffix(time_minutes)}"
+
 
 @TrackingDecorator.track_time
 def calculate_metrics(
@@ -12,23 +149,28 @@ def calculate_metrics(
     results_path,
     query,
     hexagon_resolution=7,
+    metric_property="reachable_area_union_of_buffers",
+    metric_names=(),
     year=2024,
     start_hour=None,
     end_hour=None,
     clean=False,
     quiet=False,
-):
+) -> dict[str, np.ndarray]:
     """
     Calculates metrics for each feature
     :param source_path: source path
     :param results_path: results path
     :param query: query
     :param hexagon_resolution: hexagon resolution
+    :param metric_property: property used as metric, e.g. a reachable area such as reachable_area_union_of_buffers_15min or opportunities such as opportunities_jobs_exponential
+    :param metric_names: names of registered metrics written as additional properties, or tuples of a name and a time budget in minutes if reachable areas are calculated for several time budgets
     :param year: year
     :param start_hour: start hour
     :param end_hour: end hour
     :param clean: clean
     :param quiet: quiet
+    :return: metric values and point coordinates by column name, in feature order
     """
 
     # Define area prefix
@@ -54,50 +196,89 @@ def calculate_metrics(
         f"{area_prefix}-points-{hexagon_resolution}-with-metrics.geojson",
     )
 
+    # Bind each metric to the property suffix of its time budget
+    metrics = {"metric": (property_metric(metric_property), "")}
+    for metric_name in metric_names:
+        metric_name, time_minutes = (
+            (metric_name, None) if isinstance(metric_name, str) else metric_name
+        )
+        if metric_name not in metric_registry:
+            raise ValueError(
+                f"Unknown metric {metric_name}, registered metrics are {', '.join(metric_registry)}"
+            )
+
+        metrics[build_metric_property_name(metric_name, time_minutes)] = (
+            metric_registry[metric_name],
+            build_time_budget_suffix(time_minutes),
+        )
+
+    # Collect columns compactly while streaming
+    metric_columns = {
+        column_name: array("d") for column_name in ["x", "y", *metrics.keys()]
+    }
+
     if clean or not os.path.exists(metrics_geojson_path):
-        geojson = load_geojson_file(points_geojson_path)
-
-        for feature in tqdm(
-            geojson["features"],
-            desc="Calculate metrics",
-            total=len(geojson["features"]),
-            unit="feature",
-        ):
-            feature["properties"] = {
-                "metric": feature["properties"]["reachable_area_union_of_buffers"]
-            }
-
-        write_geojson_file(
-            metrics_geojson_path,
-            geojson,
-            clean,
-            quiet,
+        # Calculate all metrics in one pass, streaming features from file to file
+        with FeatureCollectionWriter(
+            metrics_geojson_path, read_header(points_geojson_path)
+        ) as writer:
+            for feature in tqdm(
+                read_features(points_geojson_path),
+                desc="Calculate metrics",
+                unit="feature",
+            ):
+                metric_feature = {
+                    **feature,
+                    "properties": {
+                        metric_name: metric(feature["properties"], suffix)
+                        for metric_name, (metric, suffix) in metrics.items()
+                    },
+                }
+
+                writer.write(metric_feature)
+                append_metric_columns(metric_columns, metric_feature)
+
+        not quiet and print(
+            f"✓ Generate metrics into {os.path.basename(metrics_geojson_path)}"
         )
     else:
         print(f"✓ Already exists {os.path.basename(metrics_geojson_path)}")
 
+        for feature in read_features(metrics_geojson_path):
+            append_metric_columns(metric_columns, feature)
+
+    return {
+        column_name: np.frombuffer(values, dtype=float)
+        for column_name, values in metric_columns.items()
+    }
+
 
 #
 # Helpers
 #
 
 
-@cache
-def load_geojson_file(file_path):
-    with open(file=file_path, mode="r", encoding="utf-8") as geojson_file:
-        return json.load(geojson_file, strict=False)
+def read_property(properties, property_name):
+    if property_name not in properties:
+        raise ValueError(
+            f"Feature has no property {property_name}, available properties are {', '.join(properties)}"
+        )
 
+    return properties[property_name]
 
-def write_geojson_file(file_path, geojson_content, clean, quiet):
-    if not os.path.exists(file_path) or clean:
-        # Make results path
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-        with open(file_path, "w", encoding="utf-8") as geojson_file:
-            json.dump(geojson_content, geojson_file, ensure_ascii=False)
+def append_metric_columns(metric_columns, feature):
+    for column_name, values in metric_columns.items():
+        match column_name:
+            case "x":
+                value = feature["geometry"]["coordinates"][0]
+            case "y":
+                value = feature["geometry"]["coordinates"][1]
+            case _ if column_name not in feature["properties"]:
+                raise ValueError(
+                    f"Metrics file has no property {column_name}, recalculate it with clean"
+                )
+            case _:
+                value = feature["properties"][column_name]
 
-            not quiet and print(
-                f"✓ Generate metrics into {os.path.basename(file_path)}"
-            )
-    else:
-        print(f"✓ Already exists {os.path.basename(file_path)}")
+        values.append(value if value is not None else math.nan)
@@ -0,0 +1,141 @@
+import os
+from dataclasses import dataclass
+from enum import Enum
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from openlifeworlds.transform.public_transport.data_isochrone_calculator import (
+    SparseGraph,
+)
+from openlifeworlds.transform.public_transport.data_reachable_points_calculator import (
+    snap_positions,
+)
+from openlifeworlds.transform.vector_file_io import read_vector_file
+
+
+class DecayType(Enum):
+    CUMULATIVE = "cumulative"
+    LINEAR = "linear"
+    EXPONENTIAL = "exponential"
+
+
+@dataclass(frozen=True)
+class NodeOpportunities:
+    """
+    Opportunities assigned to their nearest graph nodes once per run
+    :param names: opportunity layer names
+    :param weights: summed opportunity weights by node position and layer
+    """
+
+    names: list[str]
+    weights: np.ndarray
+
+
+def load_opportunities(
+    file_path, x_column="lon", y_column="lat", crs="EPSG:4326"
+) -> gpd.GeoDataFrame:
+    """
+    Loads an opportunity layer such as population, jobs or POIs
+    :param file_path: GeoJSON, GeoParquet or FlatGeobuf file, or CSV file with coordinate columns
+    :param x_column: longitude column of CSV files
+    :param y_column: latitude column of CSV files
+    :param crs: CRS of the coordinate columns of CSV files
+    :return: opportunities in lat/lon
+    """
+    if os.path.splitext(file_path)[1].lower() == ".csv":
+        dataframe = pd.read_csv(file_path)
+        return gpd.GeoDataFrame(
+            dataframe,
+            geometry=gpd.points_from_xy(dataframe[x_column], dataframe[y_column]),
+            crs=crs,
+        ).to_crs("EPSG:4326")
+
+    return read_vector_file(file_path).to_crs("EPSG:4326")
+
+
+def prepare_node_opportunities(
+    sparse_graph: SparseGraph, opportunity_geodataframes, weight_column="weight"
+) -> NodeOpportunities:
+    """
+    Assigns opportunities to their nearest graph nodes
+    :param sparse_graph: sparse graph
+    :param opportunity_geodataframes: opportunities by layer name, polygons are represented by an inner point
+    :param weight_column: column holding the number of opportunities per feature, each feature counts once if missing
+    :return: node opportunities
+    """
+    node_count = sparse_graph.matrix.shape[0]
+    weights = np.zeros((node_count, len(opportunity_geodataframes)))
+
+    for layer_index, gdf in enumerate(opportunity_geodataframes.values()):
+        points = gdf.geometry.representative_point()
+        positions = snap_positions(sparse_graph.node_index, points.x, points.y)
+
+        # Sum all opportunities sharing a node
+        weights[:, layer_index] = np.bincount(
+            positions,
+            weights=(
+                gdf[weight_column].to_numpy(dtype=float)
+                if weight_column in gdf.columns
+                else None
+            ),
+            minlength=node_count,
+        )
+
+    return NodeOpportunities(
+        names=list(opportunity_geodataframes.keys()), weights=weights
+    )
+
+
+def calculate_opportunities(
+    node_opportunities: NodeOpportunities,
+    reached_positions,
+    travel_times,
+    cutoff_seconds,
+    decay_types=(DecayType.CUMULATIVE,),
+    decay_minutes=10,
+) -> dict[str, dict[DecayType, float]]:
+    """
+    Sums the opportunities at the reached nodes, weighted by travel time
+    :param node_opportunities: node opportunities, as returned by prepare_node_opportunities
+    :param reached_positions: reached node positions
+    :param travel_times: travel times to the reached nodes in seconds
+    :param cutoff_seconds: maximum travel time in seconds, opportunities beyond are not counted
+    :param decay_types: decay types, cumulative counts all opportunities within the cutoff
+    :param decay_minutes: time constant of exponential decay in minutes
+    :return: weighted opportunity sums by layer name and decay type
+    """
+    within_cutoff = travel_times <= cutoff_seconds
+    weights = node_opportunities.weights[reached_positions[within_cutoff]]
+    travel_times = travel_times[within_cutoff]
+
+    # Weight the opportunities of all reached nodes at once for each decay type
+    sums = {}
+    for decay_type in decay_types:
+        match DecayType(decay_type):
+            case DecayType.CUMULATIVE:
+                decay = np.ones(len(travel_times))
+            case DecayType.LINEAR:
+                decay = 1 - travel_times / cutoff_seconds
+            case DecayType.EXPONENTIAL:
+                decay = np.exp(-travel_times / (decay_minutes * 60))
+
+        sums[DecayType(decay_type)] = decay @ weights
+
+    return {
+        name: {
+            decay_type: float(layer_sums[layer_index])
+            for decay_type, layer_sums in sums.items()
+        }
+        for layer_index, name in enumerate(node_opportunities.names)
+    }
+
+
+#
+# Helpers
+#
+
+
+def build_opportunity_property_name(name, decay_type: DecayType) -> str:
+    return f"opportunities_{name}_{decay_type.value}"
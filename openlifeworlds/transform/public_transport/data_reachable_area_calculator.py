@@ -1,24 +1,64 @@
 import json
 import os
-from enum import Enum
-from functools import cache
 
 import geopandas as gpd
-import networkx as nx
 import pandas as pd
 from openlifeworlds.tracking_decorator import TrackingDecorator
-from shapely import Point, concave_hull
+from shapely import MultiPoint, Point, Polygon
 from tqdm import tqdm
 
+from openlifeworlds.transform.crs_transformer import (
+    estimate_utm_crs,
+    transform_coordinates,
+    transform_geometry,
+)
+from openlifeworlds.transform.geojson_streamer import (
+    FeatureCollectionWriter,
+    read_features,
+    read_header,
+)
+from openlifeworlds.transform.public_transport.data_isochrone_calculator import (
+    IsochroneEngineType,
+    build_reachable_points,
+    build_sparse_graph,
+    calculate_chunk_travel_times,
+    map_origin_chunks,
+    snap_origins,
+)
+from openlifeworlds.transform.public_transport.data_opportunity_calculator import (
+    DecayType,
+    build_opportunity_property_name,
+    calculate_opportunities,
+    prepare_node_opportunities,
+)
 from openlifeworlds.transform.public_transport.data_reachable_points_calculator import (
     calculate_reachable_points,
 )
-
-
-class ReachableAreaType(Enum):
-    CONVEX_HULL = "convex-hull"
-    CONCAVE_HULL = "concave-hull"
-    UNION_OF_BUFFERS = "union-of-buffers"
+from openlifeworlds.transform.public_transport.data_reachable_shape_calculator import (
+    ReachableAreaType,
+    build_grid_coverage_shape,
+    build_property_name,
+    calculate_grid_coverage,
+    calculate_reachable_shapes,
+    thin_points,
+)
+from openlifeworlds.transform.public_transport.data_reachable_stations_calculator import (
+    StationLookupType,
+    calculate_reachable_stations,
+    calculate_reachable_stations_from_graph,
+    prepare_graph_stations,
+    prepare_transit_layers,
+)
+from openlifeworlds.transform.public_transport.isochrone_cache import IsochroneCache
+from openlifeworlds.transform.public_transport.parallel_executor import (
+    ExecutorType,
+    worker_state,
+)
+from openlifeworlds.transform.vector_file_io import (
+    VectorFileFormat,
+    build_vector_file_path,
+    write_vector_file,
+)
 
 
 @TrackingDecorator.track_time
@@ -34,8 +74,28 @@ def calculate_reachable_area(
     year=2024,
     end_hour=None,
     start_hour=None,
+    reachable_area_types=tuple(ReachableAreaType),
+    transit_geodataframes=None,
+    max_points=None,
+    thinning_tolerance_meters=50,
+    report_thinning_error=False,
+    grid_cell_meters=None,
+    station_lookup_type=StationLookupType.GEOMETRY,
+    opportunity_geodataframes=None,
+    opportunity_weight_column="weight",
+    decay_types=(DecayType.CUMULATIVE,),
+    decay_minutes=10,
+    isochrone_engine_type=IsochroneEngineType.FULL_GRAPH,
+    max_access_minutes=None,
+    max_egress_minutes=None,
+    reverse=False,
     checkpoint_interval=100,
+    batch_size=32,
+    workers=1,
+    executor_type=ExecutorType.PROCESS,
+    isochrone_cache: IsochroneCache = None,
     debug=False,
+    debug_vector_file_format=VectorFileFormat.GEOJSON,
     clean=False,
     quiet=False,
 ):
@@ -59,72 +119,210 @@ def calculate_reachable_area(
     reachable_area_geojson_path = os.path.join(
         results_path,
         f"{area_prefix}-public-transport-{year}-{time_window_suffix}",
-        f"{area_prefix}-points-{hexagon_resolution}-with-reachable-area.geojson",
+        f"{area_prefix}-points-{hexagon_resolution}-with-{'reverse-' if reverse else ''}reachable-area.geojson",
     )
     checkpoint_path = reachable_area_geojson_path.replace(
-        ".geojson", "-checkpoint.geojson"
+        ".geojson", "-checkpoint.jsonl"
     )
 
     if not clean and os.path.exists(reachable_area_geojson_path):
         print(f"✓ Already exists {os.path.basename(reachable_area_geojson_path)}")
         return
 
-    if not clean and os.path.exists(checkpoint_path):
-        print(f"Resuming from checkpoint: {os.path.basename(checkpoint_path)}")
-        geojson = load_geojson_file(checkpoint_path)
-    else:
-        geojson = load_geojson_file(points_geojson_path)
-
-    # Convert node IDs to integer
-    graph = nx.convert_node_labels_to_integers(graph, label_attribute="original_id")
+    if clean and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
 
     # Estimate UTM CRS once to avoid re-calculation for every feature
     utm_crs = None
-    if geojson["features"]:
-        p0 = geojson["features"][0]["geometry"]["coordinates"]
-        utm_crs = gpd.GeoSeries(
-            [Point(p0[0], p0[1])], crs="EPSG:4326"
-        ).estimate_utm_crs()
+    first_feature = next(read_features(points_geojson_path), None)
+    if first_feature is not None:
+        p0 = first_feature["geometry"]["coordinates"]
+        utm_crs = estimate_utm_crs(p0[0], p0[1])
 
-    processed_count = 0
-    for feature in tqdm(
-        geojson["features"],
-        desc="Enhance features with reachable area",
-        total=len(geojson["features"]),
-        unit="feature",
-    ):
-        # Skip if already calculated (resumable)
-        if (
-            "reachable_area_convex_hull" in feature["properties"]
-            and "reachable_area_concave_hull" in feature["properties"]
-            and "reachable_area_union_of_buffers" in feature["properties"]
-        ):
-            continue
-
-        point = feature["geometry"]["coordinates"]
-        enhance_feature(
-            results_path,
-            area_prefix,
-            graph,
-            feature,
-            Point(point[0], point[1]),
-            time_minutes,
-            hexagon_resolution,
-            concave_hull_ratio,
-            buffer_meters,
-            debug,
-            utm_crs,
+    # Convert graph into a sparse matrix once for batched searches
+    sparse_graph = build_sparse_graph(graph)
+
+    # Search towards the points instead of from them, e.g. for catchment areas
+    search_graph = sparse_graph.reversed_graph if reverse else sparse_graph
+
+    # Project all node coordinates to UTM once
+    node_coordinates_utm = (
+        transform_coordinates(
+            sparse_graph.node_index.x, sparse_graph.node_index.y, "EPSG:4326", utm_crs
         )
+        if utm_crs is not None
+        else None
+    )
 
-        processed_count += 1
-        if processed_count % checkpoint_interval == 0:
-            write_geojson_file(checkpoint_path, geojson, clean=True, quiet=True)
+    # Prepare station lookups once
+    transit_layers = None
+    graph_stations = None
+    if StationLookupType(station_lookup_type) == StationLookupType.GRAPH:
+        # Read stations straight from the shortest path results
+        graph_stations = prepare_graph_stations(sparse_graph, transit_geodataframes)
+        transit_geodataframes = None
+    elif transit_geodataframes is not None and utm_crs is not None:
+        # Clean transit stations and build their spatial indexes
+        transit_layers = prepare_transit_layers(transit_geodataframes, utm_crs)
+
+    # Assign opportunities to their nearest nodes once
+    node_opportunities = (
+        prepare_node_opportunities(
+            sparse_graph, opportunity_geodataframes, opportunity_weight_column
+        )
+        if opportunity_geodataframes
+        else None
+    )
+
+    # Derive all time budgets from one search up to the largest budget
+    time_budgets = build_time_budgets(time_minutes)
+    reachable_area_types = [
+        ReachableAreaType(reachable_area_type)
+        for reachable_area_type in reachable_area_types
+    ]
+    decay_types = [DecayType(decay_type) for decay_type in decay_types]
+    property_names = build_property_names(
+        time_budgets,
+        reachable_area_types,
+        (transit_geodataframes or {}).keys(),
+        grid_cell_meters is not None,
+        graph_stations.types if graph_stations is not None else (),
+        node_opportunities.names if node_opportunities is not None else (),
+        decay_types,
+    )
+
+    # Index the records of a previous run instead of keeping their properties in memory
+    checkpoint_records = {}
+    if os.path.exists(checkpoint_path):
+        print(f"Resuming from checkpoint: {os.path.basename(checkpoint_path)}")
+        checkpoint_records = read_checkpoint_log(checkpoint_path, property_names)
+
+    # Skip if already calculated (resumable), keeping only the coordinates of pending points
+    pending_feature_indices = []
+    pending_points = []
+    for feature_index, feature in enumerate(read_features(points_geojson_path)):
+        _, missing_property_names = checkpoint_records.get(
+            feature_index, (None, property_names)
+        )
+        if not all(
+            property_name in feature["properties"]
+            for property_name in missing_property_names
+        ):
+            pending_feature_indices.append(feature_index)
+            pending_points.append(feature["geometry"]["coordinates"])
+
+    # Snap all origin points to their nearest graph nodes at once
+    origin_positions = snap_origins(sparse_graph, pending_points)
+
+    # Search each snapped node only once, features sharing it share the result
+    feature_indices_by_origin = {}
+    for feature_index, point, origin_position in zip(
+        pending_feature_indices, pending_points, origin_positions
+    ):
+        feature_indices_by_origin.setdefault(origin_position, (point[0], point[1], []))[
+            2
+        ].append(feature_index)
+
+    origins = [
+        (feature_indices, x, y, origin_position)
+        for origin_position, (
+            x,
+            y,
+            feature_indices,
+        ) in feature_indices_by_origin.items()
+    ]
+
+    # Make results path
+    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
 
-    write_geojson_file(
-        reachable_area_geojson_path,
-        geojson,
-        clean,
-        quiet,
+    processed_count = 0
+    with (
+        open(checkpoint_path, "ab") as checkpoint_file,
+        tqdm(
+            desc="Enhance features with reachable area",
+            total=len(pending_feature_indices),
+            unit="feature",
+        ) as progress_bar,
+    ):
+        for results in map_origin_chunks(
+            enhance_features_chunk,
+            search_graph,
+            origins,
+            max(budget for budget, _ in time_budgets) * 60,
+            state={
+                "results_path": results_path,
+                "area_prefix": area_prefix,
+                "time_budgets": time_budgets,
+                "hexagon_resolution": hexagon_resolution,
+                "concave_hull_ratio": concave_hull_ratio,
+                "buffer_meters": buffer_meters,
+                "debug": debug,
+                "debug_vector_file_format": debug_vector_file_format,
+                "utm_crs": utm_crs,
+                "node_coordinates_utm": node_coordinates_utm,
+                "reachable_area_types": reachable_area_types,
+                "transit_geodataframes": transit_geodataframes,
+                "transit_layers": transit_layers,
+                "graph_stations": graph_stations,
+                "node_opportunities": node_opportunities,
+                "decay_types": decay_types,
+                "decay_minutes": decay_minutes,
+                "max_points": max_points,
+                "thinning_tolerance_meters": thinning_tolerance_meters,
+                "report_thinning_error": report_thinning_error,
+                "grid_cell_meters": grid_cell_meters,
+            },
+            isochrone_engine_type=isochrone_engine_type,
+            max_access_minutes=max_access_minutes,
+            max_egress_minutes=max_egress_minutes,
+            batch_size=batch_size,
+            workers=workers,
+            executor_type=executor_type,
+            isochrone_cache=isochrone_cache,
+            quiet=quiet,
+        ):
+            # Append results to the checkpoint log in chunk order, which is deterministic
+            for feature_index, properties in results:
+                checkpoint_records[feature_index] = (checkpoint_file.tell(), ())
+                checkpoint_file.write(
+                    (
+                        json.dumps(
+                            {"index": feature_index, "properties": properties},
+                            ensure_ascii=False,
+                        )
+                        + "\n"
+                    ).encode("utf-8")
+                )
+
+                processed_count += 1
+                if processed_count % checkpoint_interval == 0:
+                    checkpoint_file.flush()
+                    os.fsync(checkpoint_file.fileno())
+
+                progress_bar.update(1)
+
+    # Write results once, streaming the points again and replaying their latest checkpoint records in feature order
+    with (
+        FeatureCollectionWriter(
+            reachable_area_geojson_path, read_header(points_geojson_path)
+        ) as writer,
+        open(checkpoint_path, "rb") as checkpoint_file,
+    ):
+        for feature_index, feature in enumerate(read_features(points_geojson_path)):
+            writer.write(
+                {
+                    **feature,
+                    "properties": {
+                        **feature["properties"],
+                        **read_checkpoint_record(
+                            checkpoint_file, checkpoint_records.get(feature_index)
+                        ),
+                    },
+                }
+            )
+
+    not quiet and print(
+        f"✓ Generate points into {os.path.basename(reachable_area_geojson_path)}"
     )
 
     # Clean up checkpoint
@@ -132,6 +330,63 @@ def calculate_reachable_area(
         os.remove(checkpoint_path)
 
 
+def enhance_features_chunk(chunk) -> list[tuple[int, dict]]:
+    sparse_graph = worker_state["sparse_graph"]
+    time_budgets = worker_state["time_budgets"]
+
+    results = []
+    for (feature_indices, x, y, _), (reached_positions, travel_times) in zip(
+        chunk,
+        calculate_chunk_travel_times(
+            [origin_position for _, _, _, origin_position in chunk]
+        ),
+    ):
+        feature = {"properties": {}}
+        for budget, property_suffix in time_budgets:
+            within_budget = travel_times <= budget * 60
+
+            enhance_feature(
+                worker_state["results_path"],
+                worker_state["area_prefix"],
+                None,
+                feature,
+                Point(x, y),
+                budget,
+                worker_state["hexagon_resolution"],
+                worker_state["concave_hull_ratio"],
+                worker_state["buffer_meters"],
+                worker_state["debug"],
+                worker_state["utm_crs"],
+                property_suffix=property_suffix,
+                reachable_points_utm=build_reachable_points(
+                    sparse_graph,
+                    reached_positions[within_budget],
+                    worker_state["node_coordinates_utm"],
+                ),
+                reachable_area_types=worker_state["reachable_area_types"],
+                transit_geodataframes=worker_state["transit_geodataframes"],
+                max_points=worker_state["max_points"],
+                thinning_tolerance_meters=worker_state["thinning_tolerance_meters"],
+                report_thinning_error=worker_state["report_thinning_error"],
+                grid_cell_meters=worker_state["grid_cell_meters"],
+                transit_layers=worker_state["transit_layers"],
+                graph_stations=worker_state["graph_stations"],
+                node_opportunities=worker_state["node_opportunities"],
+                decay_types=worker_state["decay_types"],
+                decay_minutes=worker_state["decay_minutes"],
+                debug_vector_file_format=worker_state["debug_vector_file_format"],
+                reached_positions=reached_positions[within_budget],
+                travel_times=travel_times[within_budget],
+            )
+
+        results.extend(
+            (feature_index, dict(feature["properties"]))
+            for feature_index in feature_indices
+        )
+
+    return results
+
+
 def enhance_feature(
     results_path,
     area_prefix,
@@ -144,162 +399,367 @@ def enhance_feature(
     buffer_meters=200,
     debug=False,
     utm_crs=None,
+    start_node_id=None,
+    reachable_points=None,
+    property_suffix="",
+    reachable_points_utm: MultiPoint = None,
+    reachable_area_types=tuple(ReachableAreaType),
+    transit_geodataframes=None,
+    max_points=None,
+    thinning_tolerance_meters=50,
+    report_thinning_error=False,
+    grid_cell_meters=None,
+    transit_layers=None,
+    graph_stations=None,
+    node_opportunities=None,
+    decay_types=(DecayType.CUMULATIVE,),
+    decay_minutes=10,
+    debug_vector_file_format=VectorFileFormat.GEOJSON,
+    reached_positions=None,
+    travel_times=None,
 ):
-    reachable_points = calculate_reachable_points(graph, reference_point, time_minutes)
-
-    # Project points to UTM once
-    reachable_points_series = gpd.GeoSeries(reachable_points, crs="EPSG:4326")
-
     # Estimate CRS if not provided (fallback)
     if utm_crs is None:
-        utm_crs = reachable_points_series.estimate_utm_crs()
+        utm_crs = estimate_utm_crs(reference_point.x, reference_point.y)
 
-    reachable_points_utm = reachable_points_series.to_crs(utm_crs)
+    if reachable_points_utm is None:
+        if reachable_points is None:
+            reachable_points = calculate_reachable_points(
+                graph, reference_point, time_minutes, start_node_id=start_node_id
+            )
 
-    # Calculate reachable area
-    reachable_area_convex_hull, reachable_area_convex_hull_gdf = (
-        calculate_reachable_area_convex_hull(reachable_points_utm, buffer_meters)
-    )
-    reachable_area_concave_hull, reachable_area_concave_hull_gdf = (
-        calculate_reachable_area_concave_hull(
-            reachable_points_utm, concave_hull_ratio, buffer_meters
+        # Project points to UTM once
+        reachable_points_utm = transform_geometry(
+            reachable_points, "EPSG:4326", utm_crs
         )
+
+    # Thin out large isochrones before calculating hulls
+    thinned_points_utm, used_tolerance_meters = thin_points(
+        reachable_points_utm, max_points, thinning_tolerance_meters
     )
-    reachable_area_union_of_buffers, reachable_area_union_of_buffers_gdf = (
-        calculate_reachable_area_union_of_buffers(reachable_points_utm, buffer_meters)
+
+    # Calculate all requested reachable shapes from the same points
+    reachable_shapes = calculate_reachable_shapes(
+        thinned_points_utm,
+        reachable_area_types,
+        concave_hull_ratio,
+        buffer_meters,
     )
 
     # Add properties to feature
-    feature["properties"]["reachable_area_convex_hull"] = reachable_area_convex_hull
-    feature["properties"]["reachable_area_concave_hull"] = reachable_area_concave_hull
-    feature["properties"]["reachable_area_union_of_buffers"] = (
-        reachable_area_union_of_buffers
-    )
+    for reachable_area_type, reachable_shape in reachable_shapes.items():
+        feature["properties"][
+            f"{build_property_name('reachable_area', reachable_area_type)}{property_suffix}"
+        ] = reachable_shape.area
+
+    if report_thinning_error:
+        feature["properties"][
+            f"reachable_area_thinning_tolerance{property_suffix}"
+        ] = used_tolerance_meters
+
+        # Compare with exact hulls, which is only worth it when points were thinned
+        exact_reachable_shapes = (
+            calculate_reachable_shapes(
+                reachable_points_utm,
+                reachable_area_types,
+                concave_hull_ratio,
+                buffer_meters,
+            )
+            if thinned_points_utm is not reachable_points_utm
+            else reachable_shapes
+        )
 
-    if debug:
-        write_gdf_as_geojson(
-            os.path.join(
-                results_path,
-                f"{area_prefix}-reachable-area",
-                f"{hexagon_resolution}",
-                f"{area_prefix}-reachable-area-convex-hull-{reference_point.x}-{reference_point.y}.geojson",
-            ),
-            reachable_area_convex_hull_gdf,
-            reference_point,
-            clean=True,
-            quiet=True,
+        for reachable_area_type, reachable_shape in reachable_shapes.items():
+            exact_area = exact_reachable_shapes[reachable_area_type].area
+            feature["properties"][
+                f"{build_property_name('reachable_area', reachable_area_type)}_thinning_error{property_suffix}"
+            ] = (
+                (reachable_shape.area - exact_area) / exact_area
+                if exact_area > 0
+                else 0.0
+            )
+
+    if grid_cell_meters is not None:
+        # Estimate union of buffers area on a grid
+        covered_cells, grid_coverage_area, grid_coverage_error = (
+            calculate_grid_coverage(
+                reachable_points_utm, buffer_meters, grid_cell_meters
+            )
         )
-        write_gdf_as_geojson(
-            os.path.join(
-                results_path,
-                f"{area_prefix}-reachable-area",
-                f"{hexagon_resolution}",
-                f"{area_prefix}-reachable-area-concave-hull-{reference_point.x}-{reference_point.y}.geojson",
-            ),
-            reachable_area_concave_hull_gdf,
-            reference_point,
-            clean=True,
-            quiet=True,
+        feature["properties"][
+            f"reachable_area_grid_coverage{property_suffix}"
+        ] = grid_coverage_area
+        feature["properties"][
+            f"reachable_area_grid_coverage_error{property_suffix}"
+        ] = grid_coverage_error
+
+    if graph_stations is not None and reached_positions is not None:
+        station_counts, station_travel_times = calculate_reachable_stations_from_graph(
+            graph_stations, reached_positions, travel_times
         )
-        write_gdf_as_geojson(
-            os.path.join(
-                results_path,
-                f"{area_prefix}-reachable-area",
-                f"{hexagon_resolution}",
-                f"{area_prefix}-reachable-area-union-of-buffers-{reference_point.x}-{reference_point.y}.geojson",
-            ),
-            reachable_area_union_of_buffers_gdf,
-            reference_point,
-            clean=True,
-            quiet=True,
+
+        for station_type, station_count in station_counts.items():
+            feature["properties"][
+                f"reachable_stations_graph_{station_type}{property_suffix}"
+            ] = station_count
+        feature["properties"][
+            f"reachable_stations_graph_travel_times{property_suffix}"
+        ] = station_travel_times
+
+    if node_opportunities is not None and reached_positions is not None:
+        opportunities = calculate_opportunities(
+            node_opportunities,
+            reached_positions,
+            travel_times,
+            time_minutes * 60,
+            decay_types,
+            decay_minutes,
         )
 
+        for name, opportunity_sums in opportunities.items():
+            for decay_type, opportunity_sum in opportunity_sums.items():
+                feature["properties"][
+                    f"{build_opportunity_property_name(name, decay_type)}{property_suffix}"
+                ] = opportunity_sum
+
+    if transit_geodataframes is not None or transit_layers is not None:
+        reachable_stations = calculate_reachable_stations(
+            reachable_shapes, utm_crs, transit_geodataframes, transit_layers
+        )
+
+        for reachable_area_type, (
+            station_counts,
+            _,
+        ) in reachable_stations.items():
+            for station_type, station_count in station_counts.items():
+                feature["properties"][
+                    f"{build_property_name('reachable_stations', reachable_area_type)}_{station_type}{property_suffix}"
+                ] = station_count
+
+    if debug:
+        for reachable_area_type, reachable_shape in reachable_shapes.items():
+            # Project to lat/lon only for debug output
+            write_gdf_as_geojson(
+                build_vector_file_path(
+                    os.path.join(
+                        results_path,
+                        f"{area_prefix}-reachable-area",
+                        f"{hexagon_resolution}",
+                        f"{area_prefix}-reachable-area-{reachable_area_type.value}{property_suffix}-{reference_point.x}-{reference_point.y}.geojson",
+                    ),
+                    debug_vector_file_format,
+                ),
+                gpd.GeoDataFrame(
+                    index=[0],
+                    crs="EPSG:4326",
+                    geometry=[
+                        transform_geometry(reachable_shape, utm_crs, "EPSG:4326")
+                    ],
+                ),
+                reference_point,
+                time_minutes,
+                clean=True,
+                quiet=True,
+            )
+
+        if grid_cell_meters is not None:
+            write_gdf_as_geojson(
+                build_vector_file_path(
+                    os.path.join(
+                        results_path,
+                        f"{area_prefix}-reachable-area",
+                        f"{hexagon_resolution}",
+                        f"{area_prefix}-reachable-area-grid-coverage{property_suffix}-{reference_point.x}-{reference_point.y}.geojson",
+                    ),
+                    debug_vector_file_format,
+                ),
+                gpd.GeoDataFrame(
+                    index=[0],
+                    crs="EPSG:4326",
+                    geometry=[
+                        transform_geometry(
+                            build_grid_coverage_shape(covered_cells, grid_cell_meters),
+                            utm_crs,
+                            "EPSG:4326",
+                        )
+                    ],
+                ),
+                reference_point,
+                time_minutes,
+                clean=True,
+                quiet=True,
+            )
+
     return feature
 
 
 def calculate_reachable_area_convex_hull(
-    points_utm, buffer_meters
-) -> (int, gpd.GeoDataFrame):
-    # Calculate convex hull
-    # Using unary_union directly on the GeoSeries of points to properly handle MultiPoint input for convex_hull if needed,
-    # though usually convex_hull can take a MultiPoint.
-    # However, points_utm is now a GeoSeries (projected).
-    hull = points_utm.unary_union.convex_hull
-
-    # Create geo series of the hull
-    geo_series_projected = gpd.GeoSeries(hull, crs=points_utm.crs)
-
-    # Add buffer
-    geo_series_projected = geo_series_projected.buffer(buffer_meters)
-
-    # Project to lat/lon
-    reachable_shape_lat_lon = gpd.GeoSeries(
-        geo_series_projected, crs=geo_series_projected.crs
-    ).to_crs("EPSG:4326")[0]
-
-    reachable_gdf = gpd.GeoDataFrame(
-        index=[0], crs="epsg:4326", geometry=[reachable_shape_lat_lon]
+    points_utm: gpd.GeoSeries, buffer_meters
+) -> (float, gpd.GeoDataFrame):
+    return build_reachable_area(
+        calculate_reachable_shapes(
+            points_utm.union_all(),
+            [ReachableAreaType.CONVEX_HULL],
+            buffer_meters=buffer_meters,
+        )[ReachableAreaType.CONVEX_HULL],
+        points_utm.crs,
     )
 
-    return geo_series_projected.area.iloc[0], reachable_gdf
-
 
 def calculate_reachable_area_concave_hull(
-    points_utm, concave_hull_ratio, buffer_meters, allow_holes=False
-) -> (int, gpd.GeoDataFrame):
-    # Calculate concave hull
-    # ratio=0.0 -> convex hull (rubber band)
-    # ratio=1.0 -> the tightest fit (connecting the dots)
-    # ratio=0.1 to 0.3 is usually the "sweet spot" for city reachability
-    hull = concave_hull(
-        points_utm.unary_union, ratio=concave_hull_ratio, allow_holes=allow_holes
+    points_utm: gpd.GeoSeries, concave_hull_ratio, buffer_meters, allow_holes=False
+) -> (float, gpd.GeoDataFrame):
+    return build_reachable_area(
+        calculate_reachable_shapes(
+            points_utm.union_all(),
+            [ReachableAreaType.CONCAVE_HULL],
+            concave_hull_ratio=concave_hull_ratio,
+            buffer_meters=buffer_meters,
+            allow_holes=allow_holes,
+        )[ReachableAreaType.CONCAVE_HULL],
+        points_utm.crs,
     )
 
-    # Create geo series
-    geo_series_projected = gpd.GeoSeries(hull, crs=points_utm.crs)
-
-    # Add buffer
-    geo_series_projected = geo_series_projected.buffer(buffer_meters)
-
-    # Project to lat/lon
-    reachable_shape_lat_lon = gpd.GeoSeries(
-        geo_series_projected, crs=geo_series_projected.crs
-    ).to_crs("EPSG:4326")[0]
 
-    reachable_gdf = gpd.GeoDataFrame(
-        index=[0], crs="epsg:4326", geometry=[reachable_shape_lat_lon]
+def calculate_reachable_area_union_of_buffers(
+    points_utm: gpd.GeoSeries, buffer_meters
+) -> (float, gpd.GeoDataFrame):
+    return build_reachable_area(
+        calculate_reachable_shapes(
+            points_utm.union_all(),
+            [ReachableAreaType.UNION_OF_BUFFERS],
+            buffer_meters=buffer_meters,
+        )[ReachableAreaType.UNION_OF_BUFFERS],
+        points_utm.crs,
     )
 
-    return geo_series_projected.area.iloc[0], reachable_gdf
-
 
-def calculate_reachable_area_union_of_buffers(
-    points_utm, buffer_meters
-) -> (int, gpd.GeoDataFrame):
-    # Optimized: Union points first (cheap), then buffer (fast)
-    # This avoids unioning thousands of circles and leverages GEOS efficient MultiPoint buffering
-    reachable_shape_meters = points_utm.unary_union.buffer(buffer_meters, resolution=4)
-
-    # Project to lat/lon
-    reachable_shape_lat_lon = gpd.GeoSeries(
-        [reachable_shape_meters], crs=points_utm.crs
-    ).to_crs("EPSG:4326")[0]
-
-    reachable_gdf = gpd.GeoDataFrame(
-        index=[0], crs="epsg:4326", geometry=[reachable_shape_lat_lon]
+def build_reachable_area(
+    reachable_shape_meters: Polygon, crs
+) -> (float, gpd.GeoDataFrame):
+    # Measure the area in the projected CRS and return the shape in lat/lon
+    return reachable_shape_meters.area, gpd.GeoDataFrame(
+        index=[0],
+        crs="epsg:4326",
+        geometry=[transform_geometry(reachable_shape_meters, crs, "EPSG:4326")],
     )
 
-    return reachable_shape_meters.area, reachable_gdf
 
-
-@cache
-def load_geojson_file(file_path):
-    with open(file=file_path, mode="r", encoding="utf-8") as geojson_file:
-        return json.load(geojson_file, strict=False)
+def build_time_budgets(time_minutes) -> list[tuple[int, str]]:
+    """
+    Builds time budgets and their property suffixes
+    :param time_minutes: single time budget, or list of time budgets in minutes
+    :return: list of time budgets and property suffixes, a single budget keeps the plain property names
+    """
+    if isinstance(time_minutes, (list, tuple)):
+        return [
+            (budget, build_time_budget_suffix(budget))
+            for budget in sorted(set(time_minutes))
+        ]
+    else:
+        return [(time_minutes, "")]
+
+
+def build_time_budget_suffix(time_minutes) -> str:
+    """
+    Builds the property suffix of a time budget, used when reachable areas are calculated for several time budgets
+    :param time_minutes: time budget in minutes, or None for a single time budget
+    :return: property suffix such as _15min, empty for a single time budget
+    """
+    return f"_{time_minutes}min" if time_minutes is not None else ""
+
+
+def build_property_names(
+    time_budgets,
+    reachable_area_types,
+    station_types=(),
+    grid_coverage=False,
+    graph_station_types=(),
+    opportunity_names=(),
+    decay_types=(),
+) -> list[str]:
+    property_names = []
+
+    for _, property_suffix in time_budgets:
+        property_names.extend(
+            f"{build_opportunity_property_name(name, decay_type)}{property_suffix}"
+            for name in opportunity_names
+            for decay_type in decay_types
+        )
+        property_names.extend(
+            f"reachable_stations_graph_{station_type}{property_suffix}"
+            for station_type in graph_station_types
+        )
+        if grid_coverage:
+            property_names.append(f"reachable_area_grid_coverage{property_suffix}")
+        for reachable_area_type in reachable_area_types:
+            property_names.append(
+                f"{build_property_name('reachable_area', reachable_area_type)}{property_suffix}"
+            )
+            property_names.extend(
+                f"{build_property_name('reachable_stations', reachable_area_type)}_{station_type}{property_suffix}"
+                for station_type in station_types
+            )
+
+    return property_names
+
+
+def read_checkpoint_log(file_path, property_names) -> dict[int, tuple[int, tuple]]:
+    """
+    Indexes the latest record of each feature in a checkpoint log
+    :param file_path: checkpoint log file path
+    :param property_names: property names calculated for each feature
+    :return: byte offset of the latest record and the property names it lacks, by feature index
+    """
+    checkpoint_records = {}
+    valid_size = 0
+
+    with open(file=file_path, mode="rb") as checkpoint_file:
+        for line in checkpoint_file:
+            if not line.endswith(b"\n"):
+                # Stop at a line that was cut off when the previous run stopped
+                break
+
+            try:
+                record = json.loads(line.decode("utf-8"), strict=False)
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                break
+
+            checkpoint_records[record["index"]] = (
+                valid_size,
+                tuple(
+                    property_name
+                    for property_name in property_names
+                    if property_name not in record["properties"]
+                ),
+            )
+            valid_size += len(line)
+
+    # Drop the cut off line so that appended records start on a new line
+    os.truncate(file_path, valid_size)
+
+    return checkpoint_records
+
+
+def read_checkpoint_record(checkpoint_file, checkpoint_record) -> dict:
+    if checkpoint_record is None:
+        return {}
+
+    offset, _ = checkpoint_record
+    checkpoint_file.seek(offset)
+
+    return json.loads(checkpoint_file.readline().decode("utf-8"), strict=False)[
+        "properties"
+    ]
 
 
 def write_gdf_as_geojson(
-    file_path, reachable_area_gdf, reference_point: Point, clean, quiet
+    file_path,
+    reachable_area_gdf,
+    reference_point: Point,
+    time_minutes=15,
+    clean=False,
+    quiet=False,
 ):
     if not os.path.exists(file_path) or clean:
         # Make results path
@@ -309,9 +769,9 @@ def write_gdf_as_geojson(
         dataframe = pd.DataFrame(
             [
                 {
-                    "geometry": reachable_area_gdf.geometry,
+                    "geometry": reachable_area_gdf.geometry.iloc[0],
                     "type": "reachable area",
-                    "description": "15-min isochrone",
+                    "description": f"{time_minutes}-min isochrone",
                 },
                 {
                     "geometry": Point(reference_point.x, reference_point.y),
@@ -322,23 +782,11 @@ def write_gdf_as_geojson(
         )
         gdf = gpd.GeoDataFrame(dataframe, geometry="geometry", crs="EPSG:4326")
 
-        gdf.to_file(file_path, driver="GeoJSON")
+        # Write in the format given by the file extension
+        write_vector_file(gdf, file_path)
 
         not quiet and print(
             f"✓ Generate reachable shape into {os.path.basename(file_path)}"
         )
     else:
         print(f"✓ Already exists {os.path.basename(file_path)}")
-
-
-def write_geojson_file(file_path, geojson_content, clean, quiet):
-    if not os.path.exists(file_path) or clean:
-        # Make results path
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-        with open(file_path, "w", encoding="utf-8") as geojson_file:
-            json.dump(geojson_content, geojson_file, ensure_ascii=False)
-
-            not quiet and print(f"✓ Generate points into {os.path.basename(file_path)}")
-    else:
-        print(f"✓ Already exists {os.path.basename(file_path)}")
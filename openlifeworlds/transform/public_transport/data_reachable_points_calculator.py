@@ -1,23 +1,54 @@
 import math
+from dataclasses import dataclass
 
 import networkx as nx
+import numpy as np
 import osmnx as ox
 from networkx import MultiDiGraph
+from scipy.spatial import KDTree
 from shapely import MultiPoint, Point
 
 
+@dataclass(frozen=True)
+class NodeIndex:
+    """
+    Spatial index over the nodes of a graph, built once and reused for all origins
+    :param node_ids: node IDs in graph order
+    :param x: longitudes in graph order
+    :param y: latitudes in graph order
+    :param valid_positions: positions of nodes with finite coordinates
+    :param tree: KDTree over the unit-sphere coordinates of the valid nodes
+    """
+
+    node_ids: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    valid_positions: np.ndarray
+    tree: KDTree
+
+
 def calculate_reachable_points(
     graph: MultiDiGraph,
     reference_point: Point,
     time_minutes: int,
+    node_index: NodeIndex = None,
+    start_node_id=None,
+    reverse=False,
 ):
     # Find nearest graph node to the reference point
-    start_node_id = ox.distance.nearest_nodes(
-        graph, reference_point.x, reference_point.y
-    )
+    if start_node_id is None:
+        start_node_id = (
+            snap_point(node_index, reference_point)
+            if node_index is not None
+            else ox.distance.nearest_nodes(graph, reference_point.x, reference_point.y)
+        )
 
+    # Search towards the start node on a reversed view, which does not copy the graph
     nodes_within_range = nx.single_source_dijkstra_path_length(
-        graph, start_node_id, cutoff=time_minutes * 60, weight="weight"
+        graph.reverse(copy=False) if reverse else graph,
+        start_node_id,
+        cutoff=time_minutes * 60,
+        weight="weight",
     )
 
     valid_coords = []
@@ -33,3 +64,62 @@ def calculate_reachable_points(
             valid_coords.append((x, y))
 
     return MultiPoint(valid_coords)
+
+
+def build_node_index(graph: MultiDiGraph) -> NodeIndex:
+    """
+    Builds a spatial index over all graph nodes
+    :param graph: graph with lon/lat node coordinates
+    :return: node index
+    """
+    node_ids = np.array(list(graph.nodes), dtype=object)
+    x = np.array(
+        [data.get("x", np.nan) for _, data in graph.nodes(data=True)], dtype=float
+    )
+    y = np.array(
+        [data.get("y", np.nan) for _, data in graph.nodes(data=True)], dtype=float
+    )
+
+    valid_positions = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+
+    return NodeIndex(
+        node_ids=node_ids,
+        x=x,
+        y=y,
+        valid_positions=valid_positions,
+        tree=KDTree(to_unit_sphere(x[valid_positions], y[valid_positions])),
+    )
+
+
+def snap_positions(node_index: NodeIndex, x, y) -> np.ndarray:
+    """
+    Finds the positions of the nearest graph nodes for many coordinates at once
+    :param node_index: node index
+    :param x: longitudes
+    :param y: latitudes
+    :return: node positions in graph order
+    """
+    _, idx = node_index.tree.query(
+        to_unit_sphere(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    )
+    return node_index.valid_positions[idx]
+
+
+def snap_point(node_index: NodeIndex, point: Point):
+    return node_index.node_ids[snap_positions(node_index, [point.x], [point.y])[0]]
+
+
+#
+# Helpers
+#
+
+
+def to_unit_sphere(x, y) -> np.ndarray:
+    # Euclidean distance on the unit sphere is monotonic in great-circle distance
+    lon = np.radians(x)
+    lat = np.radians(y)
+    cos_lat = np.cos(lat)
+
+    return np.column_stack(
+        [cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)]
+    ).reshape(-1, 3)
@@ -0,0 +1,172 @@
+import math
+from enum import Enum
+
+import numpy as np
+from shapely import MultiPoint, Polygon, box, concave_hull, get_coordinates, union_all
+
+
+class ReachableAreaType(Enum):
+    CONVEX_HULL = "convex-hull"
+    CONCAVE_HULL = "concave-hull"
+    UNION_OF_BUFFERS = "union-of-buffers"
+
+
+def calculate_reachable_shapes(
+    points_utm: MultiPoint,
+    reachable_area_types=tuple(ReachableAreaType),
+    concave_hull_ratio=0.2,
+    buffer_meters=200,
+    allow_holes=False,
+) -> dict[ReachableAreaType, Polygon]:
+    """
+    Calculates all requested reachable shapes from one set of reached points
+    :param points_utm: reached points in a metric CRS, shared by all shapes
+    :param reachable_area_types: reachable area types to calculate, others are skipped
+    :param concave_hull_ratio: concave hull ratio
+    :param buffer_meters: buffer in meters
+    :param allow_holes: allow holes in concave hull
+    :return: reachable shapes in the CRS of the points by reachable area type
+    """
+    reachable_shapes = {}
+
+    for reachable_area_type in reachable_area_types:
+        match ReachableAreaType(reachable_area_type):
+            case ReachableAreaType.CONVEX_HULL:
+                # Calculate convex hull and add buffer
+                hull = points_utm.convex_hull
+                reachable_shape = hull.buffer(buffer_meters)
+            case ReachableAreaType.CONCAVE_HULL:
+                # Calculate concave hull
+                # ratio=0.0 -> convex hull (rubber band)
+                # ratio=1.0 -> the tightest fit (connecting the dots)
+                # ratio=0.1 to 0.3 is usually the "sweet spot" for city reachability
+                hull = concave_hull(
+                    points_utm, ratio=concave_hull_ratio, allow_holes=allow_holes
+                )
+                reachable_shape = hull.buffer(buffer_meters)
+            case ReachableAreaType.UNION_OF_BUFFERS:
+                # Optimized: Buffer all points at once (fast)
+                # This avoids unioning thousands of circles and leverages GEOS efficient MultiPoint buffering
+                reachable_shape = points_utm.buffer(buffer_meters, resolution=4)
+
+        reachable_shapes[ReachableAreaType(reachable_area_type)] = reachable_shape
+
+    return reachable_shapes
+
+
+def thin_points(
+    points_utm: MultiPoint, max_points=None, tolerance_meters=50
+) -> (MultiPoint, float):
+    """
+    Thins out points on a grid so that at most a given number of points remain
+    :param points_utm: points in a metric CRS
+    :param max_points: maximum number of points kept, at least 1, nothing is thinned if not set
+    :param tolerance_meters: maximum distance between a dropped point and the point kept in its grid cell,
+    grown until the points fit into max_points cells
+    :return: thinned points, one per grid cell, and the tolerance used, 0 if nothing was thinned
+    """
+    if max_points is not None and max_points < 1:
+        raise ValueError(f"max_points must be at least 1, got {max_points}")
+
+    coordinates = get_coordinates(points_utm)
+
+    if max_points is None or len(coordinates) <= max_points:
+        return points_utm, 0.0
+
+    # Any two points within a cell are at most one cell diagonal apart
+    cell_size = tolerance_meters / math.sqrt(2)
+    # Anchor cells at the lower left point so that one cell eventually holds all points
+    offsets = coordinates - coordinates.min(axis=0)
+
+    while True:
+        cells = np.floor(offsets / cell_size).astype(np.int64)
+
+        # Keep the first point of each cell
+        _, indices = np.unique(cells, axis=0, return_index=True)
+
+        if len(indices) <= max_points:
+            return MultiPoint(coordinates[np.sort(indices)]), cell_size * math.sqrt(2)
+
+        # Cell counts shrink with the square of the cell size for areas and linearly for lines
+        cell_size *= max(math.sqrt(len(indices) / max_points), 1.1)
+
+
+def calculate_grid_coverage(
+    points_utm: MultiPoint, buffer_meters=200, cell_size_meters=50
+) -> (np.ndarray, float, float):
+    """
+    Estimates the union of buffers area by dilating the grid cells of the points
+    :param points_utm: points in a metric CRS
+    :param buffer_meters: buffer in meters
+    :param cell_size_meters: grid cell size in meters
+    :return: covered cells as column and row indices, covered area, and error bound of the area
+    """
+    coordinates = get_coordinates(points_utm)
+
+    if len(coordinates) == 0:
+        return np.empty((0, 2), dtype=np.int64), 0.0, 0.0
+
+    # Collect the distinct cells containing points
+    point_cells = np.unique(
+        np.floor(coordinates / cell_size_meters).astype(np.int64), axis=0
+    )
+
+    # Dilate with all cell offsets whose centers are within the buffer
+    radius = int(math.ceil(buffer_meters / cell_size_meters))
+    offset_range = np.arange(-radius, radius + 1)
+    offsets = np.stack(np.meshgrid(offset_range, offset_range), axis=-1).reshape(-1, 2)
+    offsets = offsets[
+        (offsets**2).sum(axis=1) * cell_size_meters**2 <= buffer_meters**2
+    ]
+
+    covered_cells = np.unique(
+        (point_cells[:, None, :] + offsets[None, :, :]).reshape(-1, 2), axis=0
+    )
+
+    # Points are moved to cell centers and cells are tested at their centers, which misclassifies
+    # at most cells within one cell diagonal of the boundary, i.e. cells on the inner and outer boundary ring
+    boundary_cell_count = count_boundary_cells(covered_cells)
+    cell_area = cell_size_meters**2
+
+    return (
+        covered_cells,
+        float(len(covered_cells) * cell_area),
+        float(boundary_cell_count * cell_area),
+    )
+
+
+def build_grid_coverage_shape(covered_cells, cell_size_meters=50) -> Polygon:
+    return union_all(
+        box(
+            covered_cells[:, 0] * cell_size_meters,
+            covered_cells[:, 1] * cell_size_meters,
+            (covered_cells[:, 0] + 1) * cell_size_meters,
+            (covered_cells[:, 1] + 1) * cell_size_meters,
+        )
+    )
+
+
+#
+# Helpers
+#
+
+
+def count_boundary_cells(cells) -> int:
+    neighbour_offsets = np.array([[1, 0], [-1, 0], [0, 1], [0, -1]])
+
+    # Encode cells as complex numbers for fast set lookups
+    keys = cells[:, 0] + 1j * cells[:, 1]
+    neighbour_keys = (cells[:, None, :] + neighbour_offsets[None, :, :]).reshape(-1, 2)
+    neighbour_keys = neighbour_keys[:, 0] + 1j * neighbour_keys[:, 1]
+
+    is_covered = np.isin(neighbour_keys, keys).reshape(-1, 4)
+
+    # Covered cells next to an uncovered cell and the distinct uncovered cells next to them
+    inner_ring = np.count_nonzero(~is_covered.all(axis=1))
+    outer_ring = len(np.unique(neighbour_keys[~is_covered.reshape(-1)]))
+
+    return int(inner_ring + outer_ring)
+
+
+def build_property_name(prefix, reachable_area_type: ReachableAreaType) -> str:
+    return f"{prefix}_{reachable_area_type.value.replace('-', '_')}"
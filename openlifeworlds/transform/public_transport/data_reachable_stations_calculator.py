@@ -1,61 +1,200 @@
+from dataclasses import dataclass
+from enum import Enum
+
 import geopandas as gpd
+import numpy as np
 import pandas as pd
-from shapely import concave_hull
+from shapely import Polygon, STRtree
+
+from openlifeworlds.transform.public_transport.data_isochrone_calculator import (
+    SparseGraph,
+)
+from openlifeworlds.transform.public_transport.data_reachable_shape_calculator import (
+    ReachableAreaType,
+    calculate_reachable_shapes,
+)
+
+
+class StationLookupType(Enum):
+    GEOMETRY = "geometry"
+    GRAPH = "graph"
+
+
+@dataclass(frozen=True)
+class TransitLayer:
+    """
+    Transit stations of one type prepared once per run
+    :param stations: cleaned stations in lat/lon
+    :param tree: spatial index over the stations in the CRS of the reachable shapes
+    """
+
+    stations: gpd.GeoDataFrame
+    tree: STRtree
+
+
+def prepare_transit_layers(transit_geodataframes, utm_crs) -> dict[str, TransitLayer]:
+    """
+    Cleans transit stations and builds their spatial indexes
+    :param transit_geodataframes: transit stations by type
+    :param utm_crs: CRS of the reachable shapes
+    :return: transit layers by type
+    """
+    return {
+        key: TransitLayer(
+            stations=clean_geodataframe(value, type=key).reset_index(drop=True),
+            tree=STRtree(value.geometry.to_crs(utm_crs).values),
+        )
+        for key, value in transit_geodataframes.items()
+    }
 
 
-def calculate_reachable_stations_convex_hull(
-    points_utm,
-    buffer_meters,
+def calculate_reachable_stations(
+    reachable_shapes: dict[ReachableAreaType, Polygon],
+    utm_crs,
     transit_geodataframes=None,
-) -> (dict[str, int], gpd.GeoDataFrame):
-    # Calculate convex hull
-    # Using unary_union directly on the GeoSeries of points to properly handle MultiPoint input for convex_hull if needed,
-    # though usually convex_hull can take a MultiPoint.
-    # However, points_utm is now a GeoSeries (projected).
-
-    if transit_geodataframes is None:
-        transit_geodataframes = {}
+    transit_layers: dict[str, TransitLayer] = None,
+) -> dict[ReachableAreaType, tuple[dict[str, int], gpd.GeoDataFrame]]:
+    """
+    Finds the transit stations within each reachable shape
+    :param reachable_shapes: reachable shapes by reachable area type, as returned by calculate_reachable_shapes
+    :param utm_crs: CRS of the reachable shapes
+    :param transit_geodataframes: transit stations by type, only used if no transit layers are given
+    :param transit_layers: transit layers by type, as returned by prepare_transit_layers
+    :return: station counts by type and stations, by reachable area type
+    """
+    if transit_layers is None:
+        transit_layers = prepare_transit_layers(transit_geodataframes or {}, utm_crs)
+
+    reachable_stations = {}
+
+    for reachable_area_type, reachable_shape in reachable_shapes.items():
+        # Query each layer once with the projected shape
+        geodataframes = [
+            transit_layer.stations.iloc[
+                np.sort(transit_layer.tree.query(reachable_shape, predicate="contains"))
+            ]
+            for transit_layer in transit_layers.values()
+        ]
+
+        reachable_stations[reachable_area_type] = (
+            {
+                key: len(geodataframe)
+                for key, geodataframe in zip(transit_layers.keys(), geodataframes)
+            },
+            gpd.GeoDataFrame(
+                pd.concat(
+                    geodataframes,
+                    ignore_index=True,
+                ),
+                geometry="geometry",
+                crs="EPSG:4326",
+            ),
+        )
 
-    hull = points_utm.unary_union.convex_hull
+    return reachable_stations
+
+
+@dataclass(frozen=True)
+class GraphStations:
+    """
+    Transit stop nodes of a sparse graph prepared once per run
+    :param lookup: station index by node position, -1 for nodes that are no stations
+    :param stop_ids: GTFS stop IDs by station index
+    :param type_codes: station type code by station index
+    :param types: station types by type code
+    """
+
+    lookup: np.ndarray
+    stop_ids: np.ndarray
+    type_codes: np.ndarray
+    types: list[str]
+
+
+def prepare_graph_stations(
+    sparse_graph: SparseGraph, transit_geodataframes=None
+) -> GraphStations:
+    """
+    Maps node positions to transit stops
+    :param sparse_graph: sparse graph
+    :param transit_geodataframes: transit stations by type with a stop_id column, all stops have type "transit" if not set
+    :return: graph stations
+    """
+    stop_ids = sparse_graph.transit_stop_ids
+
+    if transit_geodataframes:
+        types = list(transit_geodataframes.keys())
+        type_code_by_stop_id = {
+            str(stop_id): type_code
+            for type_code, value in enumerate(transit_geodataframes.values())
+            for stop_id in value["stop_id"]
+        }
+        type_codes = np.array(
+            [type_code_by_stop_id.get(stop_id, -1) for stop_id in stop_ids],
+            dtype=np.int64,
+        )
+    else:
+        types = ["transit"]
+        type_codes = np.zeros(len(stop_ids), dtype=np.int64)
 
-    # Create geo series of the hull
-    geo_series_projected = gpd.GeoSeries(hull, crs=points_utm.crs)
+    lookup = np.full(sparse_graph.matrix.shape[0], -1, dtype=np.int64)
+    lookup[sparse_graph.transit_positions] = np.arange(len(stop_ids))
 
-    # Add buffer
-    geo_series_projected = geo_series_projected.buffer(buffer_meters)
+    return GraphStations(
+        lookup=lookup, stop_ids=stop_ids, type_codes=type_codes, types=types
+    )
 
-    # Project to lat/lon
-    reachable_shape_lat_lon = gpd.GeoSeries(
-        geo_series_projected, crs=geo_series_projected.crs
-    ).to_crs("EPSG:4326")[0]
 
-    reachable_gdf = gpd.GeoDataFrame(
-        index=[0], crs="epsg:4326", geometry=[reachable_shape_lat_lon]
+def calculate_reachable_stations_from_graph(
+    graph_stations: GraphStations, reached_positions, travel_times
+) -> (dict[str, int], dict[str, float]):
+    """
+    Reads the reachable transit stops straight from a shortest path result
+    :param graph_stations: graph stations, as returned by prepare_graph_stations
+    :param reached_positions: reached node positions
+    :param travel_times: travel times to the reached nodes in seconds
+    :return: station counts by type, and travel times in seconds by stop ID
+    """
+    station_indices = graph_stations.lookup[reached_positions]
+    is_station = station_indices >= 0
+    station_indices = station_indices[is_station]
+
+    # Count stations by type, ignoring stops without a type
+    type_codes = graph_stations.type_codes[station_indices]
+    counts = np.bincount(
+        type_codes[type_codes >= 0], minlength=len(graph_stations.types)
     )
 
-    geodataframes = [
-        clean_geodataframe(
-            gpd.sjoin(value, reachable_gdf, predicate="within"), type=key
-        )
-        for key, value in transit_geodataframes.items()
-    ]
-
     return (
         {
-            key: len(geodataframe)
-            for key, geodataframe in zip(transit_geodataframes.keys(), geodataframes)
+            station_type: int(count)
+            for station_type, count in zip(graph_stations.types, counts)
+        },
+        {
+            stop_id: float(travel_time)
+            for stop_id, travel_time in zip(
+                graph_stations.stop_ids[station_indices],
+                travel_times[is_station],
+            )
         },
-        gpd.GeoDataFrame(
-            pd.concat(
-                geodataframes,
-                ignore_index=True,
-            ),
-            geometry="geometry",
-            crs="EPSG:4326",
-        ),
     )
 
 
+def calculate_reachable_stations_convex_hull(
+    points_utm,
+    buffer_meters,
+    transit_geodataframes=None,
+) -> (dict[str, int], gpd.GeoDataFrame):
+    return calculate_reachable_stations(
+        calculate_reachable_shapes(
+            points_utm.union_all(),
+            [ReachableAreaType.CONVEX_HULL],
+            buffer_meters=buffer_meters,
+        ),
+        points_utm.crs,
+        transit_geodataframes,
+    )[ReachableAreaType.CONVEX_HULL]
+
+
 def calculate_reachable_stations_concave_hull(
     points_utm,
     concave_hull_ratio,
@@ -63,54 +202,17 @@ def calculate_reachable_stations_concave_hull(
     allow_holes=False,
     transit_geodataframes=None,
 ) -> (dict[str, int], gpd.GeoDataFrame):
-    # Calculate concave hull
-    # ratio=0.0 -> convex hull (rubber band)
-    # ratio=1.0 -> the tightest fit (connecting the dots)
-    # ratio=0.1 to 0.3 is usually the "sweet spot" for city reachability
-
-    if transit_geodataframes is None:
-        transit_geodataframes = {}
-
-    hull = concave_hull(
-        points_utm.unary_union, ratio=concave_hull_ratio, allow_holes=allow_holes
-    )
-
-    # Create geo series
-    geo_series_projected = gpd.GeoSeries(hull, crs=points_utm.crs)
-
-    # Add buffer
-    geo_series_projected = geo_series_projected.buffer(buffer_meters)
-
-    # Project to lat/lon
-    reachable_shape_lat_lon = gpd.GeoSeries(
-        geo_series_projected, crs=geo_series_projected.crs
-    ).to_crs("EPSG:4326")[0]
-
-    reachable_gdf = gpd.GeoDataFrame(
-        index=[0], crs="epsg:4326", geometry=[reachable_shape_lat_lon]
-    )
-
-    geodataframes = [
-        clean_geodataframe(
-            gpd.sjoin(value, reachable_gdf, predicate="within"), type=key
-        )
-        for key, value in transit_geodataframes.items()
-    ]
-
-    return (
-        {
-            key: len(geodataframe)
-            for key, geodataframe in zip(transit_geodataframes.keys(), geodataframes)
-        },
-        gpd.GeoDataFrame(
-            pd.concat(
-                geodataframes,
-                ignore_index=True,
-            ),
-            geometry="geometry",
-            crs="EPSG:4326",
+    return calculate_reachable_stations(
+        calculate_reachable_shapes(
+            points_utm.union_all(),
+            [ReachableAreaType.CONCAVE_HULL],
+            concave_hull_ratio=concave_hull_ratio,
+            buffer_meters=buffer_meters,
+            allow_holes=allow_holes,
         ),
-    )
+        points_utm.crs,
+        transit_geodataframes,
+    )[ReachableAreaType.CONCAVE_HULL]
 
 
 def calculate_reachable_stations_union_of_buffers(
@@ -118,43 +220,15 @@ def calculate_reachable_stations_union_of_buffers(
     buffer_meters,
     transit_geodataframes=None,
 ) -> (dict[str, int], gpd.GeoDataFrame):
-    if transit_geodataframes is None:
-        transit_geodataframes = {}
-
-    # Optimized: Union points first (cheap), then buffer (fast)
-    # This avoids unioning thousands of circles and leverages GEOS efficient MultiPoint buffering
-    reachable_shape_meters = points_utm.unary_union.buffer(buffer_meters, resolution=4)
-
-    # Project to lat/lon
-    reachable_shape_lat_lon = gpd.GeoSeries(
-        [reachable_shape_meters], crs=points_utm.crs
-    ).to_crs("EPSG:4326")[0]
-
-    reachable_gdf = gpd.GeoDataFrame(
-        index=[0], crs="epsg:4326", geometry=[reachable_shape_lat_lon]
-    )
-
-    geodataframes = [
-        clean_geodataframe(
-            gpd.sjoin(value, reachable_gdf, predicate="within"), type=key
-        )
-        for key, value in transit_geodataframes.items()
-    ]
-
-    return (
-        {
-            key: len(geodataframe)
-            for key, geodataframe in zip(transit_geodataframes.keys(), geodataframes)
-        },
-        gpd.GeoDataFrame(
-            pd.concat(
-                geodataframes,
-                ignore_index=True,
-            ),
-            geometry="geometry",
-            crs="EPSG:4326",
+    return calculate_reachable_stations(
+        calculate_reachable_shapes(
+            points_utm.union_all(),
+            [ReachableAreaType.UNION_OF_BUFFERS],
+            buffer_meters=buffer_meters,
         ),
-    )
+        points_utm.crs,
+        transit_geodataframes,
+    )[ReachableAreaType.UNION_OF_BUFFERS]
 
 
 #
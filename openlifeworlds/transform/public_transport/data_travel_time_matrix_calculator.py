@@ -0,0 +1,309 @@
+import os
+import shutil
+from dataclasses import dataclass
+
+import h3
+import numpy as np
+from openlifeworlds.tracking_decorator import TrackingDecorator
+from scipy.sparse import csr_matrix
+from tqdm import tqdm
+
+from openlifeworlds.transform.geojson_streamer import read_features
+from openlifeworlds.transform.public_transport.data_isochrone_calculator import (
+    IsochroneEngineType,
+    SparseGraph,
+    build_sparse_graph,
+    calculate_chunk_travel_times,
+    keep_minimum,
+    map_origin_chunks,
+    snap_origins,
+)
+from openlifeworlds.transform.public_transport.isochrone_cache import IsochroneCache
+from openlifeworlds.transform.public_transport.parallel_executor import (
+    ExecutorType,
+    worker_state,
+)
+
+
+@dataclass(frozen=True)
+class TravelTimeMatrix:
+    """
+    Travel times between hexagons, rows are origin hexagons and columns are destination hexagons
+    :param origin_cells: H3 cells of the rows as integers
+    :param destination_cells: H3 cells of the columns as integers
+    :param matrix: minimum travel times in seconds, hexagons not reachable within the cutoff have no entry
+    """
+
+    origin_cells: np.ndarray
+    destination_cells: np.ndarray
+    matrix: csr_matrix
+
+
+@TrackingDecorator.track_time
+def calculate_travel_time_matrix(
+    source_path,
+    results_path,
+    query,
+    graph,
+    hexagon_resolution=7,
+    destination_hexagon_resolution=None,
+    time_minutes=15,
+    year=2024,
+    end_hour=None,
+    start_hour=None,
+    isochrone_engine_type=IsochroneEngineType.FULL_GRAPH,
+    max_access_minutes=None,
+    max_egress_minutes=None,
+    batch_size=32,
+    workers=1,
+    executor_type=ExecutorType.PROCESS,
+    isochrone_cache: IsochroneCache = None,
+    clean=False,
+    quiet=False,
+):
+    """
+    Calculates travel times from every origin hexagon to every destination hexagon within a cutoff
+    :param source_path: source path
+    :param results_path: results path
+    :param query: query
+    :param graph: graph
+    :param hexagon_resolution: hexagon resolution of the points, also used for the origin hexagons
+    :param destination_hexagon_resolution: hexagon resolution of the destination hexagons, same as origins if not set
+    :param time_minutes: cutoff in minutes
+    :param year: year
+    :param end_hour: end hour
+    :param start_hour: start hour
+    :param isochrone_engine_type: isochrone engine type
+    :param max_access_minutes: walk budget of the two-phase engine from an origin, exact results if not set
+    :param max_egress_minutes: walk budget of the two-phase engine from the last stop, exact results if not set
+    :param batch_size: number of origin hexagons searched at once
+    :param workers: number of workers
+    :param executor_type: executor type
+    :param isochrone_cache: isochrone cache, nothing is cached if not set
+    :param clean: clean
+    :param quiet: quiet
+    """
+
+    # Define area prefix
+    area_prefix = (
+        "-".join(list(reversed(query.split(",")))[1:]).lower().replace(" ", "")
+    )
+    # Define time window suffix
+    time_window_suffix = (
+        f"{str(start_hour).zfill(2)}-{str(end_hour).zfill(2)}"
+        if start_hour is not None and end_hour is not None
+        else "avg"
+    )
+
+    if destination_hexagon_resolution is None:
+        destination_hexagon_resolution = hexagon_resolution
+
+    # Define paths
+    points_geojson_path = os.path.join(
+        source_path,
+        f"{area_prefix}-points",
+        f"{area_prefix}-points-{hexagon_resolution}.geojson",
+    )
+    travel_time_matrix_path = os.path.join(
+        results_path,
+        f"{area_prefix}-public-transport-{year}-{time_window_suffix}",
+        f"{area_prefix}-points-{hexagon_resolution}-travel-time-matrix-{destination_hexagon_resolution}",
+    )
+
+    if not clean and os.path.exists(travel_time_matrix_path):
+        print(f"✓ Already exists {os.path.basename(travel_time_matrix_path)}")
+        return
+
+    # Keep only the coordinates of the points
+    points = [
+        feature["geometry"]["coordinates"]
+        for feature in read_features(points_geojson_path)
+    ]
+
+    # Convert graph into a sparse matrix once for batched searches
+    sparse_graph = build_sparse_graph(graph)
+
+    # Assign every node to its destination hexagon once
+    destination_cells, node_cell_codes = build_node_cells(
+        sparse_graph, destination_hexagon_resolution
+    )
+
+    # Snap all points to their nearest graph nodes at once
+    origin_positions = snap_origins(sparse_graph, points)
+
+    # Group the snapped nodes of all points within the same origin hexagon
+    origin_positions_by_cell = {}
+    for point, origin_position in zip(points, origin_positions):
+        origin_positions_by_cell.setdefault(
+            h3.str_to_int(h3.latlng_to_cell(point[1], point[0], hexagon_resolution)),
+            set(),
+        ).add(int(origin_position))
+
+    origins = sorted(
+        (cell, sorted(positions))
+        for cell, positions in origin_positions_by_cell.items()
+    )
+
+    indptr = [0]
+    indices = []
+    data = []
+
+    with tqdm(
+        desc="Calculate travel time matrix", total=len(origins), unit="hexagon"
+    ) as progress_bar:
+        for results in map_origin_chunks(
+            calculate_travel_time_rows,
+            sparse_graph,
+            origins,
+            time_minutes * 60,
+            state={"node_cell_codes": node_cell_codes},
+            isochrone_engine_type=isochrone_engine_type,
+            max_access_minutes=max_access_minutes,
+            max_egress_minutes=max_egress_minutes,
+            batch_size=batch_size,
+            workers=workers,
+            executor_type=executor_type,
+            isochrone_cache=isochrone_cache,
+            quiet=quiet,
+        ):
+            for cell_codes, travel_times in results:
+                indices.append(cell_codes)
+                data.append(travel_times)
+                indptr.append(indptr[-1] + len(cell_codes))
+
+                progress_bar.update(1)
+
+    write_travel_time_matrix(
+        travel_time_matrix_path,
+        TravelTimeMatrix(
+            origin_cells=np.array([cell for cell, _ in origins], dtype=np.uint64),
+            destination_cells=destination_cells,
+            matrix=csr_matrix(
+                (
+                    np.concatenate(data) if data else np.empty(0, dtype=np.float32),
+                    np.concatenate(indices) if indices else np.empty(0, dtype=np.int64),
+                    np.array(indptr, dtype=np.int64),
+                ),
+                shape=(len(origins), len(destination_cells)),
+            ),
+        ),
+        clean,
+        quiet,
+    )
+
+
+def calculate_travel_time_rows(chunk) -> list[tuple[np.ndarray, np.ndarray]]:
+    node_cell_codes = worker_state["node_cell_codes"]
+
+    # Search each snapped node of the chunk once
+    origin_positions = sorted(
+        {position for _, positions in chunk for position in positions}
+    )
+    travel_times_by_position = dict(
+        zip(
+            origin_positions,
+            calculate_chunk_travel_times(origin_positions),
+        )
+    )
+
+    rows = []
+    for _, positions in chunk:
+        cell_codes = np.concatenate(
+            [
+                node_cell_codes[travel_times_by_position[position][0]]
+                for position in positions
+            ]
+        )
+        travel_times = np.concatenate(
+            [travel_times_by_position[position][1] for position in positions]
+        )
+
+        # Keep the fastest node of each destination hexagon, reached from any point of the origin hexagon
+        is_valid = cell_codes >= 0
+        cell_codes, travel_times = keep_minimum(
+            cell_codes[is_valid], travel_times[is_valid]
+        )
+        rows.append((cell_codes, travel_times.astype(np.float32)))
+
+    return rows
+
+
+def load_travel_time_matrix(file_path, mmap_mode="r") -> TravelTimeMatrix:
+    """
+    Loads a travel time matrix without reading it into memory
+    :param file_path: directory written by calculate_travel_time_matrix
+    :param mmap_mode: memory-map mode passed to numpy, None reads all arrays into memory
+    :return: travel time matrix
+    """
+    arrays = {
+        name: np.load(os.path.join(file_path, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in ["origin_cells", "destination_cells", "indptr", "indices", "data"]
+    }
+
+    return TravelTimeMatrix(
+        origin_cells=arrays["origin_cells"],
+        destination_cells=arrays["destination_cells"],
+        matrix=csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=(len(arrays["origin_cells"]), len(arrays["destination_cells"])),
+            copy=False,
+        ),
+    )
+
+
+#
+# Helpers
+#
+
+
+def build_node_cells(
+    sparse_graph: SparseGraph, hexagon_resolution
+) -> (np.ndarray, np.ndarray):
+    node_index = sparse_graph.node_index
+
+    # Look up the hexagon of every node with valid coordinates
+    cells = np.array(
+        [
+            h3.str_to_int(h3.latlng_to_cell(y, x, hexagon_resolution))
+            for x, y in zip(
+                node_index.x[node_index.valid_positions],
+                node_index.y[node_index.valid_positions],
+            )
+        ],
+        dtype=np.uint64,
+    )
+    destination_cells, codes = np.unique(cells, return_inverse=True)
+
+    node_cell_codes = np.full(sparse_graph.matrix.shape[0], -1, dtype=np.int64)
+    node_cell_codes[node_index.valid_positions] = codes
+
+    return destination_cells, node_cell_codes
+
+
+def write_travel_time_matrix(
+    file_path, travel_time_matrix: TravelTimeMatrix, clean, quiet
+):
+    if not os.path.exists(file_path) or clean:
+        # Write into a temporary directory so that readers never see a partial matrix
+        temporary_file_path = f"{file_path}.tmp"
+        shutil.rmtree(temporary_file_path, ignore_errors=True)
+        os.makedirs(temporary_file_path)
+
+        # Store plain arrays, which can be memory-mapped unlike compressed archives
+        for name, array in [
+            ("origin_cells", travel_time_matrix.origin_cells),
+            ("destination_cells", travel_time_matrix.destination_cells),
+            ("indptr", travel_time_matrix.matrix.indptr),
+            ("indices", travel_time_matrix.matrix.indices),
+            ("data", travel_time_matrix.matrix.data),
+        ]:
+            np.save(os.path.join(temporary_file_path, f"{name}.npy"), array)
+
+        shutil.rmtree(file_path, ignore_errors=True)
+        os.replace(temporary_file_path, file_path)
+
+        not quiet and print(
+            f"✓ Generate travel time matrix into {os.path.basename(file_path)}"
+        )
+    else:
+        print(f"✓ Already exists {os.path.basename(file_path)}")
@@ -0,0 +1,365 @@
+import gzip
+import json
+import math
+import os
+import shutil
+import sqlite3
+from contextlib import closing
+from enum import Enum
+
+import mapbox_vector_tile
+import numpy as np
+import pandas as pd
+from openlifeworlds.tracking_decorator import TrackingDecorator
+from shapely import STRtree, box, clip_by_rect, is_empty, simplify
+from tqdm import tqdm
+
+from openlifeworlds.transform.crs_transformer import transform_coordinates
+from openlifeworlds.transform.vector_file_io import (
+    VectorFileFormat,
+    build_vector_file_path,
+    read_vector_file,
+)
+
+# Half the width of the Web Mercator world in meters
+world_half_size = 20037508.342789244
+
+
+class TileFormat(Enum):
+    DIRECTORY = "directory"
+    MBTILES = "mbtiles"
+
+
+@TrackingDecorator.track_time
+def generate_vector_tiles(
+    source_path,
+    results_path,
+    query,
+    hexagon_resolution=7,
+    hexagon_resolution_max=9,
+    layer_names=("hexagons", "metrics"),
+    min_zoom=8,
+    max_zoom=14,
+    tile_format=TileFormat.DIRECTORY,
+    extent=4096,
+    buffer_pixels=64,
+    simplification_pixels=1.0,
+    vector_file_format=VectorFileFormat.GEOJSON,
+    year=2024,
+    start_hour=None,
+    end_hour=None,
+    clean=False,
+    quiet=False,
+):
+    """
+    Generates a z/x/y vector tile pyramid from hexagon and metric layers
+    :param source_path: source path
+    :param results_path: results path
+    :param query: query
+    :param hexagon_resolution: hexagon resolution of the hexagon layer
+    :param hexagon_resolution_max: max hexagon resolution, i.e. the resolution of the points of the metric layer
+    :param layer_names: layers to include, hexagons from calculate_hexagons and metrics from calculate_metrics
+    :param min_zoom: min zoom level
+    :param max_zoom: max zoom level
+    :param tile_format: tile directory with z/x/y.pbf files, or MBTiles file
+    :param extent: tile extent in tile coordinates
+    :param buffer_pixels: buffer around tiles in pixels of a 256 pixel tile, avoiding seams between tiles
+    :param simplification_pixels: simplification tolerance in pixels of a 256 pixel tile
+    :param vector_file_format: vector file format of the hexagon layer as written by calculate_hexagons
+    :param year: year
+    :param start_hour: start hour
+    :param end_hour: end hour
+    :param clean: clean
+    :param quiet: quiet
+    """
+
+    # Define area prefix
+    area_prefix = (
+        "-".join(list(reversed(query.split(",")))[1:]).lower().replace(" ", "")
+    )
+    # Define time window suffix
+    time_window_suffix = (
+        f"{str(start_hour).zfill(2)}-{str(end_hour).zfill(2)}"
+        if start_hour is not None and end_hour is not None
+        else "avg"
+    )
+
+    tile_format = TileFormat(tile_format)
+
+    # Define paths, metrics are calculated for the points of the max hexagon resolution
+    layer_file_paths = {
+        layer_name: os.path.join(
+            source_path,
+            f"{area_prefix}-public-transport-{year}-{time_window_suffix}",
+            f"{area_prefix}-points-{hexagon_resolution_max if layer_name == 'metrics' else hexagon_resolution}-with-{layer_name}.geojson",
+        )
+        for layer_name in layer_names
+    }
+    # Metrics are always streamed as GeoJSON
+    if "hexagons" in layer_file_paths:
+        layer_file_paths["hexagons"] = build_vector_file_path(
+            layer_file_paths["hexagons"], vector_file_format
+        )
+    tiles_path = os.path.join(
+        results_path,
+        f"{area_prefix}-public-transport-{year}-{time_window_suffix}",
+        f"{area_prefix}-points-{hexagon_resolution}-tiles"
+        + (".mbtiles" if tile_format == TileFormat.MBTILES else ""),
+    )
+
+    if not clean and os.path.exists(tiles_path):
+        print(f"✓ Already exists {os.path.basename(tiles_path)}")
+        return
+
+    # Project layers to Web Mercator once
+    layers = {
+        layer_name: read_vector_file(layer_file_path).to_crs("EPSG:3857")
+        for layer_name, layer_file_path in layer_file_paths.items()
+    }
+
+    tiles = (
+        (zoom, x, y, tile)
+        for zoom in range(min_zoom, max_zoom + 1)
+        for x, y, tile in build_tiles(
+            layers, zoom, extent, buffer_pixels, simplification_pixels
+        )
+    )
+
+    write_tiles(
+        tiles_path,
+        tiles,
+        tile_format,
+        build_metadata(os.path.basename(tiles_path), layers, min_zoom, max_zoom),
+        quiet,
+    )
+
+
+def build_metadata(name, layers, min_zoom, max_zoom) -> list[tuple[str, str]]:
+    """
+    Builds the MBTiles metadata describing the layers of a tileset
+    :param name: tileset name
+    :param layers: geo dataframes in Web Mercator by layer name
+    :param min_zoom: min zoom level
+    :param max_zoom: max zoom level
+    :return: metadata names and values
+    """
+    metadata = [
+        ("name", name),
+        ("format", "pbf"),
+        ("minzoom", str(min_zoom)),
+        ("maxzoom", str(max_zoom)),
+        (
+            "json",
+            json.dumps(
+                {
+                    "vector_layers": [
+                        {
+                            "id": layer_name,
+                            "fields": {
+                                column: build_field_type(gdf[column].dtype)
+                                for column in gdf.columns
+                                # Missing values are left out of tiles, so empty columns are too
+                                if column != gdf.geometry.name
+                                and gdf[column].notna().any()
+                            },
+                            "minzoom": min_zoom,
+                            "maxzoom": max_zoom,
+                        }
+                        for layer_name, gdf in layers.items()
+                    ]
+                }
+            ),
+        ),
+    ]
+
+    # Bounds and center are given in longitude and latitude
+    bounds = np.array([gdf.total_bounds for gdf in layers.values() if len(gdf) > 0])
+    if len(bounds) > 0:
+        (west, east), (south, north) = transform_coordinates(
+            [bounds[:, 0].min(), bounds[:, 2].max()],
+            [bounds[:, 1].min(), bounds[:, 3].max()],
+            "EPSG:3857",
+            "EPSG:4326",
+        )
+        metadata.extend(
+            [
+                ("bounds", f"{west},{south},{east},{north}"),
+                ("center", f"{(west + east) / 2},{(south + north) / 2},{min_zoom}"),
+            ]
+        )
+
+    return metadata
+
+
+def build_tiles(layers, zoom, extent=4096, buffer_pixels=64, simplification_pixels=1.0):
+    """
+    Encodes all tiles of a zoom level that contain features
+    :param layers: geo dataframes in Web Mercator by layer name
+    :param zoom: zoom level
+    :param extent: tile extent in tile coordinates
+    :param buffer_pixels: buffer around tiles in pixels of a 256 pixel tile
+    :param simplification_pixels: simplification tolerance in pixels of a 256 pixel tile
+    :return: generator of tile column, tile row from the top, and encoded tile
+    """
+    tile_size = 2 * world_half_size / 2**zoom
+    buffer_size = buffer_pixels * tile_size / 256
+
+    # Simplify each layer once per zoom level and index it for tile queries
+    prepared_layers = {}
+    for layer_name, gdf in layers.items():
+        geometries = simplify(
+            gdf.geometry.values, simplification_pixels * tile_size / 256
+        )
+        prepared_layers[layer_name] = (
+            geometries,
+            [
+                clean_properties(record)
+                for record in gdf.drop(columns="geometry").to_dict(orient="records")
+            ],
+            STRtree(geometries),
+        )
+
+    # Visit only tiles within the bounds of all layers
+    bounds = np.array([gdf.total_bounds for gdf in layers.values() if len(gdf) > 0])
+    if len(bounds) == 0:
+        return
+
+    min_x, min_y = bounds[:, 0].min(), bounds[:, 1].min()
+    max_x, max_y = bounds[:, 2].max(), bounds[:, 3].max()
+    columns = range(
+        to_tile_index(min_x - buffer_size, tile_size, zoom),
+        to_tile_index(max_x + buffer_size, tile_size, zoom) + 1,
+    )
+    rows = range(
+        to_tile_index(-(max_y + buffer_size), tile_size, zoom),
+        to_tile_index(-(min_y - buffer_size), tile_size, zoom) + 1,
+    )
+
+    for x in columns:
+        for y in rows:
+            tile_bounds = (
+                -world_half_size + x * tile_size,
+                world_half_size - (y + 1) * tile_size,
+                -world_half_size + (x + 1) * tile_size,
+                world_half_size - y * tile_size,
+            )
+            buffered_tile_bounds = (
+                tile_bounds[0] - buffer_size,
+                tile_bounds[1] - buffer_size,
+                tile_bounds[2] + buffer_size,
+                tile_bounds[3] + buffer_size,
+            )
+
+            tile_layers = []
+            for layer_name, (geometries, properties, tree) in prepared_layers.items():
+                indices = np.sort(tree.query(box(*buffered_tile_bounds)))
+
+                # Clip to the buffered tile, dropping features that only touch it
+                clipped_geometries = clip_by_rect(
+                    geometries[indices], *buffered_tile_bounds
+                )
+                is_kept = ~is_empty(clipped_geometries)
+
+                if np.any(is_kept):
+                    tile_layers.append(
+                        {
+                            "name": layer_name,
+                            "features": [
+                                {
+                                    "geometry": geometry,
+                                    "properties": properties[index],
+                                }
+                                for geometry, index in zip(
+                                    clipped_geometries[is_kept], indices[is_kept]
+                                )
+                            ],
+                        }
+                    )
+
+            if tile_layers:
+                yield x, y, mapbox_vector_tile.encode(
+                    tile_layers,
+                    default_options={"quantize_bounds": tile_bounds, "extents": extent},
+                )
+
+
+#
+# Helpers
+#
+
+
+def to_tile_index(coordinate, tile_size, zoom) -> int:
+    return min(
+        max(int(math.floor((coordinate + world_half_size) / tile_size)), 0),
+        2**zoom - 1,
+    )
+
+
+def build_field_type(dtype) -> str:
+    # Vector tile fields are typed as in TileJSON
+    if pd.api.types.is_bool_dtype(dtype):
+        return "Boolean"
+    elif pd.api.types.is_numeric_dtype(dtype):
+        return "Number"
+    else:
+        return "String"
+
+
+def clean_properties(properties) -> dict:
+    # Vector tiles only hold plain values, missing values are left out
+    return {
+        key: value.item() if isinstance(value, np.generic) else value
+        for key, value in properties.items()
+        if value is not None and not (isinstance(value, float) and math.isnan(value))
+    }
+
+
+def write_tiles(tiles_path, tiles, tile_format, metadata, quiet):
+    # Make results path
+    os.makedirs(os.path.dirname(tiles_path), exist_ok=True)
+
+    tile_count = 0
+
+    match tile_format:
+        case TileFormat.DIRECTORY:
+            shutil.rmtree(tiles_path, ignore_errors=True)
+
+            for zoom, x, y, tile in tqdm(
+                tiles, desc="Generate vector tiles", unit="tile"
+            ):
+                tile_path = os.path.join(tiles_path, str(zoom), str(x), f"{y}.pbf")
+                os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+
+                with open(tile_path, "wb") as tile_file:
+                    tile_file.write(tile)
+                tile_count += 1
+        case TileFormat.MBTILES:
+            if os.path.exists(tiles_path):
+                os.remove(tiles_path)
+
+            # The connection commits as a context manager but is only closed explicitly
+            with closing(sqlite3.connect(tiles_path)) as connection, connection:
+                connection.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+                connection.execute(
+                    "CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+                )
+                connection.execute(
+                    "CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)"
+                )
+                connection.executemany(
+                    "INSERT INTO metadata (name, value) VALUES (?, ?)", metadata
+                )
+
+                # MBTiles counts rows from the bottom and stores gzipped tiles
+                for zoom, x, y, tile in tqdm(
+                    tiles, desc="Generate vector tiles", unit="tile"
+                ):
+                    connection.execute(
+                        "INSERT INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                        (zoom, x, 2**zoom - 1 - y, gzip.compress(tile)),
+                    )
+                    tile_count += 1
+
+    not quiet and print(
+        f"✓ Generate {tile_count} vector tiles into {os.path.basename(tiles_path)}"
+    )
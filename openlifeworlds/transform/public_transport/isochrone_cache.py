@@ -0,0 +1,99 @@
+import os
+from collections import OrderedDict
+from threading import Lock, get_ident
+
+import numpy as np
+
+
+class IsochroneCache:
+    """
+    Caches reached nodes and travel times keyed by graph fingerprint, origin node and cutoff
+    :param cache_path: optional directory for a disk store shared between runs and processes
+    :param max_bytes: maximum size of the entries kept in memory per process, 12 bytes per reached node, i.e. about
+    1.2 MB for a city-wide isochrone of 100k nodes, least recently used entries are evicted first, unbounded if None
+    """
+
+    def __init__(self, cache_path=None, max_bytes=256 * 1024**2):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.lock = Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled, workers started without fork get an empty copy
+        return {"cache_path": self.cache_path, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def get(self, fingerprint, origin_position, cutoff_seconds):
+        key = (fingerprint, int(origin_position), float(cutoff_seconds))
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        file_path = self.build_file_path(*key)
+        if file_path is not None and os.path.exists(file_path):
+            with np.load(file_path) as data:
+                value = data["positions"], data["travel_times"]
+            self.put_in_memory(key, value)
+            return value
+
+        return None
+
+    def put(
+        self, fingerprint, origin_position, cutoff_seconds, positions, travel_times
+    ):
+        key = (fingerprint, int(origin_position), float(cutoff_seconds))
+        value = (
+            np.asarray(positions, dtype=np.int32),
+            np.asarray(travel_times, dtype=float),
+        )
+        self.put_in_memory(key, value)
+
+        file_path = self.build_file_path(*key)
+        if file_path is not None and not os.path.exists(file_path):
+            # Make cache path
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+            # Write atomically so that concurrent workers never read partial files
+            temporary_file_path = f"{file_path}.{os.getpid()}-{get_ident()}.tmp.npz"
+            np.savez(temporary_file_path, positions=value[0], travel_times=value[1])
+            os.replace(temporary_file_path, file_path)
+
+    def put_in_memory(self, key, value):
+        with self.lock:
+            if key in self.entries:
+                self.size_bytes -= build_size_bytes(self.entries.pop(key))
+
+            self.entries[key] = value
+            self.size_bytes += build_size_bytes(value)
+
+            # Evict least recently used entries, including the new one if it exceeds the limit on its own
+            while self.max_bytes is not None and self.size_bytes > self.max_bytes:
+                _, evicted_value = self.entries.popitem(last=False)
+                self.size_bytes -= build_size_bytes(evicted_value)
+
+    def build_file_path(self, fingerprint, origin_position, cutoff_seconds):
+        if self.cache_path is None:
+            return None
+
+        return os.path.join(
+            self.cache_path,
+            fingerprint,
+            f"{cutoff_seconds:g}",
+            f"{origin_position}.npz",
+        )
+
+
+#
+# Helpers
+#
+
+
+def build_size_bytes(value) -> int:
+    positions, travel_times = value
+    return positions.nbytes + travel_times.nbytes
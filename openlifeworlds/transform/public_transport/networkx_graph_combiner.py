@@ -9,6 +9,12 @@ from networkx import DiGraph, MultiDiGraph
 from openlifeworlds.tracking_decorator import TrackingDecorator
 from scipy.spatial import KDTree
 
+from openlifeworlds.transform.vector_file_io import (
+    VectorFileFormat,
+    build_vector_file_path,
+    write_vector_file,
+)
+
 
 @TrackingDecorator.track_time
 def combine_graphs(
@@ -20,6 +26,7 @@ def combine_graphs(
     start_hour=None,
     end_hour=None,
     debug=False,
+    debug_vector_file_format=VectorFileFormat.GEOJSON,
     clean=False,
     quiet=False,
 ) -> MultiDiGraph:
@@ -94,7 +101,9 @@ def combine_graphs(
         save_graph_as_graphml(graph, graph_file_path)
         save_graph_as_pickle(graph, pickle_file_path)
         debug and save_graph_as_geojson(
-            graph, geojson_nodes_file_path, geojson_edges_file_path
+            graph,
+            build_vector_file_path(geojson_nodes_file_path, debug_vector_file_format),
+            build_vector_file_path(geojson_edges_file_path, debug_vector_file_format),
         )
 
         not quiet and print(
@@ -159,9 +168,9 @@ def save_graph_as_geojson(graph: MultiDiGraph, nodes_file_path, edges_file_path)
         if edges_gdf[col].apply(lambda x: isinstance(x, list)).any():
             edges_gdf[col] = edges_gdf[col].astype(str)
 
-    # Save as geojson
-    nodes_gdf.to_file(filename=nodes_file_path, driver="GeoJSON")
-    edges_gdf.to_file(filename=edges_file_path, driver="GeoJSON")
+    # Save in the format given by the file extension
+    write_vector_file(nodes_gdf, nodes_file_path)
+    write_vector_file(edges_gdf, edges_file_path)
 
 
 @cache
@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from multiprocessing import get_all_start_methods, get_context
+
+# Read-only state of the current process, set by init_worker
+worker_state = {}
+
+
+class ExecutorType(Enum):
+    PROCESS = "process"
+    THREAD = "thread"
+
+
+def init_worker(state):
+    """
+    Stores shared read-only state for the tasks of a worker, replacing the state of a previous run
+    :param state: dictionary read by the tasks via worker_state
+    """
+    worker_state.clear()
+    worker_state.update(state)
+
+
+def map_ordered(
+    function,
+    tasks,
+    workers=1,
+    initializer=None,
+    initargs=(),
+    executor_type=ExecutorType.PROCESS,
+):
+    """
+    Applies a function to tasks in a worker pool and yields results in task order
+    :param function: module-level function called with a single task
+    :param tasks: iterable of picklable tasks
+    :param workers: number of workers, 1 runs in the current thread
+    :param initializer: module-level function storing shared read-only state for the workers
+    :param initargs: arguments of the initializer, shared via fork where available instead of pickled per task
+    :param executor_type: process pool, or thread pool sharing the state in memory instead of copying it per worker,
+    threads only run Python code in parallel on free-threaded builds and their speedup there is not measured yet, see
+    benchmarks/parallel_executor_benchmark.py
+    :return: generator of results in task order
+    """
+    executor_type = ExecutorType(executor_type)
+    in_process = workers is None or workers <= 1
+
+    # Threads share the state of the current process, so it is initialized once
+    if in_process or executor_type == ExecutorType.THREAD:
+        if initializer is not None:
+            initializer(*initargs)
+
+    if in_process:
+        for task in tasks:
+            yield function(task)
+        return
+
+    if executor_type == ExecutorType.THREAD:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(function, tasks)
+        return
+
+    # Forked workers inherit the initializer arguments copy-on-write, other start methods pickle them once per worker
+    context = (
+        get_context("fork") if "fork" in get_all_start_methods() else get_context()
+    )
+
+    with context.Pool(
+        processes=workers, initializer=initializer, initargs=initargs
+    ) as pool:
+        yield from pool.imap(function, tasks)
@@ -0,0 +1,91 @@
+import os
+from enum import Enum
+
+import geopandas as gpd
+
+
+class VectorFileFormat(Enum):
+    GEOJSON = "geojson"
+    GEOPARQUET = "geoparquet"
+    FLATGEOBUF = "flatgeobuf"
+
+
+# File extensions by vector file format
+file_extensions = {
+    VectorFileFormat.GEOJSON: ".geojson",
+    VectorFileFormat.GEOPARQUET: ".parquet",
+    VectorFileFormat.FLATGEOBUF: ".fgb",
+}
+
+
+def read_vector_file(file_path, columns=None, bbox=None) -> gpd.GeoDataFrame:
+    """
+    Reads a vector file column-wise through Arrow
+    :param file_path: GeoJSON, GeoParquet or FlatGeobuf file path, the format is derived from the extension
+    :param columns: columns to read, all columns if not set
+    :param bbox: bounding box to read, in the CRS of the file, FlatGeobuf uses its spatial index
+    :return: geo dataframe
+    """
+    if get_vector_file_format(file_path) == VectorFileFormat.GEOPARQUET:
+        gdf = gpd.read_parquet(file_path, columns=columns, bbox=bbox)
+
+        # Return named indexes as columns like the other formats do
+        return gdf.reset_index() if any(gdf.index.names) else gdf
+
+    return gpd.read_file(
+        file_path, columns=columns, bbox=bbox, engine="pyogrio", use_arrow=True
+    )
+
+
+def write_vector_file(gdf: gpd.GeoDataFrame, file_path, vector_file_format=None):
+    """
+    Writes a vector file column-wise through Arrow
+    :param gdf: geo dataframe
+    :param file_path: file path
+    :param vector_file_format: vector file format, derived from the extension if not set, FlatGeobuf files are
+    written with a spatial index and therefore in spatial order
+    """
+    if vector_file_format is None:
+        vector_file_format = get_vector_file_format(file_path)
+
+    match VectorFileFormat(vector_file_format):
+        case VectorFileFormat.GEOJSON:
+            gdf.to_file(file_path, driver="GeoJSON", engine="pyogrio", use_arrow=True)
+        case VectorFileFormat.GEOPARQUET:
+            gdf.to_parquet(file_path)
+        case VectorFileFormat.FLATGEOBUF:
+            gdf.to_file(
+                file_path,
+                driver="FlatGeobuf",
+                engine="pyogrio",
+                use_arrow=True,
+                SPATIAL_INDEX="YES",
+            )
+
+
+def build_vector_file_path(file_path, vector_file_format) -> str:
+    """
+    Replaces the extension of a file path with the one of a vector file format
+    :param file_path: file path
+    :param vector_file_format: vector file format
+    :return: file path with matching extension
+    """
+    return (
+        os.path.splitext(file_path)[0]
+        + file_extensions[VectorFileFormat(vector_file_format)]
+    )
+
+
+#
+# Helpers
+#
+
+
+def get_vector_file_format(file_path) -> VectorFileFormat:
+    extension = os.path.splitext(file_path)[1].lower()
+
+    for vector_file_format, file_extension in file_extensions.items():
+        if extension == file_extension:
+            return vector_file_format
+
+    return VectorFileFormat.GEOJSON